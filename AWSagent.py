@@ -1,11 +1,18 @@
 from langgraph.graph import StateGraph, MessagesState, START, END
-from langchain.messages import HumanMessage, SystemMessage, ToolMessage
+from langchain.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
 from langgraph.checkpoint.memory import MemorySaver
+from sqliteCheckpointer import open_checkpointer
 from typing import Literal
 from langchain.tools import tool
 from dotenv import load_dotenv
 import os
-from awsRAG import retrival_argumented_generation
+import uuid
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from awsRAG import rag_context, warmup as warmup_rag
+from queryNormalizer import normalize, QUERY_FAST_PATH_MIN_CONFIDENCE
+from actionPolicy import classify_action, parse_diagnosis
+from instrumentation import metrics, METRICS_PORT
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_ollama import ChatOllama
 from prompts import RAG_planner_prompt1, RAG_agent_prompt1, OPERATOR_agent_prompt1, FINAL_reponse_prompt1
@@ -13,6 +20,12 @@ from langgraph.types import Command, interrupt
 
 load_dotenv()
 
+# Rewrite the query deterministically and start retrieval without the rag_planner LLM
+RAG_FAST_PATH = os.getenv("RAG_FAST_PATH", "0") == "1"
+# Set AWSTool flags from the action policy table; the operator LLM only handles what it can't match
+OPERATOR_POLICY = os.getenv("OPERATOR_POLICY", "1") == "1"
+# Conversation turns kept in the thread state (0 keeps everything)
+AGENT_HISTORY_TURNS = int(os.getenv("AGENT_HISTORY_TURNS", "4"))
 
 
 # ================= MODEL =================
@@ -34,15 +47,9 @@ def RAG(query: str) -> str:
         Args:
             query: str
     """
-    docs = retrival_argumented_generation(query)
+    context = rag_context(query)
 
-    # Ensure output is always plain string
-    if isinstance(docs, list):
-        if isinstance(docs[0], dict) and "text" in docs[0]:
-            return "\n".join(d["text"] for d in docs)
-        return "\n".join(str(d) for d in docs)
-
-    return str(docs)
+    return context or "No relevant documents found."
 
 @tool
 def AWSTool(service: str, configuration_item: str, action: str, reversible: bool, highImpact: bool ) -> str:
@@ -85,80 +92,138 @@ tools_by_name = {
     "AWSTool": AWSTool
 }
 
-def append_if_valid(state, response):
+# Nodes return only the messages they add; the add_messages reducer appends them
+def append_if_valid(response):
     if response.content or response.tool_calls:
-        return {"messages": state["messages"] + [response]}
-    return {"messages": state["messages"]}
+        return {"messages": [response]}
+    return {"messages": []}
 
 # ================= TOOL NODE =================
 
-def rag_tool_node(state: MessagesState):
+# Tools without side effects or interrupts; their calls in one message run concurrently
+READ_ONLY_TOOLS = {"RAG"}
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "4"))
+tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+
+def run_tool(tool_call):
+    tool = tools_by_name[tool_call["name"]]
+    observation = tool.invoke(tool_call["args"])
+
+    if isinstance(observation, list):
+        observation = str(observation)
+
+    return ToolMessage(
+        content=str(observation),
+        tool_call_id=tool_call["id"]
+    )
+
+def tool_node(state: MessagesState):
     last = state["messages"][-1]
-    results = []
+    tool_calls = last.tool_calls
 
-    for tool_call in last.tool_calls:
-        tool = tools_by_name[tool_call["name"]]
-        observation = tool.invoke(tool_call["args"])
+    # Each pooled call gets a copy of the node's context so the graph config and callbacks follow it
+    parallel = [i for i, c in enumerate(tool_calls) if c["name"] in READ_ONLY_TOOLS]
+    futures = {}
+    if len(parallel) > 1:
+        futures = {
+            i: tool_pool.submit(contextvars.copy_context().run, run_tool, tool_calls[i])
+            for i in parallel
+        }
 
-        if isinstance(observation, list):
-            observation = str(observation)
+    # AWSTool may interrupt, which only works on the node's own thread: run serially, in order
+    results = [
+        futures[i].result() if i in futures else run_tool(tool_call)
+        for i, tool_call in enumerate(tool_calls)
+    ]
 
-        results.append(
-            ToolMessage(
-                content=str(observation),
-                tool_call_id=tool_call["id"]
-            )
-        )
+    return {"messages": results}
 
-    return {"messages": state["messages"] + results}
+# ================= NODES =================
 
-def operator_tool_node(state: MessagesState):
-    last = state["messages"][-1]
-    results = []
+# Keep the last AGENT_HISTORY_TURNS turns so prompts and checkpoints stop growing
+def prune_history(state: MessagesState):
+    messages = state["messages"]
+    if AGENT_HISTORY_TURNS <= 0:
+        return {"messages": []}
 
-    for tool_call in last.tool_calls:
-        tool = tools_by_name[tool_call["name"]]
-        observation = tool.invoke(tool_call["args"])
+    # Cut on a HumanMessage so tool calls are never split from their results
+    turn_starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if len(turn_starts) <= AGENT_HISTORY_TURNS:
+        return {"messages": []}
 
-        if isinstance(observation, list):
-            observation = str(observation)
+    cut = turn_starts[-AGENT_HISTORY_TURNS]
+    return {"messages": [RemoveMessage(id=m.id) for m in messages[:cut]]}
 
-        results.append(
-            ToolMessage(
-                content=str(observation),
-                tool_call_id=tool_call["id"]
-            )
-        )
+# 0. Query Normalizer (optional, no LLM)
+def query_normalizer(state: MessagesState):
+    last = state["messages"][-1]
+    if not isinstance(last, HumanMessage):
+        return {"messages": []}
 
-    return {"messages": state["messages"] + results}
+    normalized = normalize(last.content)
+    if normalized["confidence"] < QUERY_FAST_PATH_MIN_CONFIDENCE:
+        # Not sure what to retrieve: let the planner LLM rewrite it
+        return {"messages": []}
 
-# ================= NODES =================
+    tool_call = {"name": "RAG", "args": {"query": normalized["query"]}, "id": f"fast_path_{uuid.uuid4().hex}"}
+    return {"messages": [AIMessage(content="", tool_calls=[tool_call])]}
 
 # 1. RAG Planner (must call RAG)
 def rag_planner(state: MessagesState):
     system_prompt = SystemMessage(content=RAG_planner_prompt1)
     response = rag_model.invoke([system_prompt] + state["messages"])
-    return append_if_valid(state, response)
+    return append_if_valid(response)
 
 # 2. Rerank Agent
 def rerank_agent(state: MessagesState):
     system_prompt = SystemMessage(content=RAG_agent_prompt1)
 
     response = model.invoke([system_prompt] + state["messages"])
-    return append_if_valid(state, response)
+    return append_if_valid(response)
 
 # 3. Operator Agent (must call AWStool)
+def policy_tool_call(state: MessagesState):
+    """AWSTool call built from the diagnosis and the action policy table, or None"""
+    diagnosis = parse_diagnosis(str(state["messages"][-1].content))
+    action = diagnosis.get("REQUIRED_ACTION")
+    service = diagnosis.get("SERVICE")
+    configuration_item = diagnosis.get("CONFIGURATION_ITEM")
+    if not (action and service and configuration_item):
+        return None
+
+    request = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
+    flags = classify_action(action, configuration_item, request)
+    if flags is None:
+        return None
+
+    return AIMessage(content="", tool_calls=[{
+        "name": "AWSTool",
+        "args": {
+            "service": service,
+            "configuration_item": configuration_item,
+            "action": action,
+            "reversible": flags["reversible"],
+            "highImpact": flags["highImpact"],
+        },
+        "id": f"policy_{uuid.uuid4().hex}",
+    }])
+
 def operator_agent(state: MessagesState):
+    if OPERATOR_POLICY:
+        response = policy_tool_call(state)
+        if response is not None:
+            return append_if_valid(response)
+
     system_prompt = SystemMessage(content=OPERATOR_agent_prompt1)
 
     response = operator_model.invoke([system_prompt] + state["messages"])
-    return append_if_valid(state, response)
+    return append_if_valid(response)
 
 # 4. Final Response Agent
 def final_response(state: MessagesState):
     system_prompt = SystemMessage(content=FINAL_reponse_prompt1)
     response = model.invoke([system_prompt] + state["messages"])
-    return append_if_valid(state, response)
+    return append_if_valid(response)
 
 # ================= ROUTING =================
 
@@ -171,6 +236,15 @@ def should_call_rag_tool(state: MessagesState) -> Literal["rag_tool_node", "rera
     return "rerank_agent"
 
 
+def should_use_fast_path(state: MessagesState) -> Literal["rag_tool_node", "rag_planner"]:
+    last = state["messages"][-1]
+
+    if getattr(last, "tool_calls", None):
+        return "rag_tool_node"
+
+    return "rag_planner"
+
+
 def should_call_operator_tool(state: MessagesState) -> Literal["operator_tool_node", "final_response"]:
     last = state["messages"][-1]
 
@@ -183,14 +257,26 @@ def should_call_operator_tool(state: MessagesState) -> Literal["operator_tool_no
 
 graph = StateGraph(MessagesState)
 
-graph.add_node("rag_planner", rag_planner)
-graph.add_node("rerank_agent", rerank_agent)
-graph.add_node("operator_agent", operator_agent)
-graph.add_node("rag_tool_node", rag_tool_node)
-graph.add_node("operator_tool_node", operator_tool_node)
-graph.add_node("final_response", final_response)
-
-graph.add_edge(START, "rag_planner")
+graph.add_node("prune_history", metrics.node("prune_history", prune_history))
+graph.add_node("rag_planner", metrics.node("rag_planner", rag_planner))
+graph.add_node("rerank_agent", metrics.node("rerank_agent", rerank_agent))
+graph.add_node("operator_agent", metrics.node("operator_agent", operator_agent))
+graph.add_node("rag_tool_node", metrics.node("rag_tool_node", tool_node))
+graph.add_node("operator_tool_node", metrics.node("operator_tool_node", tool_node))
+graph.add_node("final_response", metrics.node("final_response", final_response))
+
+graph.add_edge(START, "prune_history")
+
+if RAG_FAST_PATH:
+    graph.add_node("query_normalizer", metrics.node("query_normalizer", query_normalizer))
+    graph.add_edge("prune_history", "query_normalizer")
+    graph.add_conditional_edges(
+        "query_normalizer",
+        should_use_fast_path,
+        ["rag_tool_node", "rag_planner"]
+    )
+else:
+    graph.add_edge("prune_history", "rag_planner")
 
 # RAG phase
 graph.add_conditional_edges(
@@ -218,14 +304,28 @@ graph.add_edge("final_response", END)
 # checkpointer = MemorySaver()
 # agent = graph.compile(checkpointer=checkpointer)
 
+# sqlite keeps threads on disk with eviction, memory keeps them in-process forever
+AGENT_CHECKPOINTER = os.getenv("AGENT_CHECKPOINTER", "sqlite")
+
 from functools import lru_cache
 @lru_cache
 def get_agent():
-    checkpointer = MemorySaver()
+    if AGENT_CHECKPOINTER == "sqlite":
+        checkpointer = open_checkpointer()
+    else:
+        checkpointer = MemorySaver()
     return graph.compile(checkpointer=checkpointer)
 
 agent = get_agent()
 
+# Prometheus text on /metrics, per-thread totals on /threads
+if metrics.enabled and METRICS_PORT:
+    metrics.serve(METRICS_PORT)
+
+# Load the embedding model + index handle at startup instead of on the first RAG call
+if os.getenv("RAG_WARMUP", "0") == "1":
+    warmup_rag()
+
 # ================= TEST =================
 
 # messages = [
@@ -0,0 +1,108 @@
+from typing import Dict, List, Optional, Pattern, Tuple
+import re
+
+# --------------------------------------------------
+# ACTION POLICY
+# Deterministic reversible / highImpact flags for AWSTool, computed from a
+# policy table of action verbs x resource naming patterns x environment
+# tags. Requests the table cannot classify are left to the operator LLM.
+# Only an explicit non-production tag on the resource makes an action low
+# impact; untagged resources need human approval.
+# --------------------------------------------------
+
+DIAGNOSIS_FIELDS = ("ROOT_CAUSE", "SERVICE", "CONFIGURATION_ITEM", "REQUIRED_ACTION")
+DIAGNOSIS_RE = re.compile(
+    r"^[\s>*#-]*\**(" + "|".join(DIAGNOSIS_FIELDS) + r")\**\s*:\**[ \t]*(.*)$",
+    re.MULTILINE,
+)
+
+
+def _words(*words: str) -> Pattern:
+    return re.compile(r"\b(?:" + "|".join(words) + r")\b", re.IGNORECASE)
+
+
+# (verb class, pattern, reversible); first match wins, so the more specific
+# phrasings come first
+VERB_TABLE: List[Tuple[str, Pattern, bool]] = [
+    ("destroy", _words(r"permanently (?:delete|remove)", "delete", "terminate", "destroy", "purge", "drop", "schedule key deletion"), False),
+    ("revoke", _words("remove", "detach", "revoke", "disable", "deactivate", "deny", "restrict", "block", "stop"), True),
+    ("grant", _words("attach", "grant", "allow", "add", "create", "enable", "assign", "tag"), True),
+    ("change", _words("update", "modify", "change", "edit", "correct", "fix", "set", "replace", "rotate", "configure", "reset", "restart", "start"), True),
+]
+
+# Resources whose change is high impact whatever the environment
+PRIVILEGED_RESOURCE_RE = re.compile(
+    r"AdministratorAccess|\w*FullAccess\b|\w*FullControl\b|PowerUserAccess|IAMFullAccess"
+    r"|\broot (?:user|account)\b|\bservice control polic|\bSCPs?\b|\bpermissions? boundar|\bAWS Organizations\b"
+    # Wildcard actions and principals: "Action": "*", Action *:*, s3:*, "Principal": "*", Principal *
+    r"|\"Action\"\s*:\s*\"\*\"|\baction \*|(?<![\w*])\*:\*|\b[a-z0-9-]+:\*"
+    r"|\"Principal\"\s*:\s*(?:\{\s*\"AWS\"\s*:\s*)?\"\*\"|\bprincipals?\s*[:=]?\s*[\"']?\*"
+    # Public access and long-lived credentials
+    r"|\bmake\b[^.\n]*\bpublic\b|\bpublic(?:ly)?[ -](?:access|read|write|readable|writable|bucket|acl)|\bAllUsers\b|\bAuthenticatedUsers\b"
+    r"|\baccess[ -]keys?\b",
+    re.IGNORECASE,
+)
+
+
+def _tags(*words: str) -> Pattern:
+    """Tags as name parts, CamelCase included: Prod-App-Role, app_prod, ProdDatabase, myProdDb, PROD_DB, not products."""
+    forms = []
+    for word in words:
+        forms += [
+            rf"(?<![A-Za-z0-9]){word}(?![a-z])",
+            rf"(?<![A-Z0-9]){word.capitalize()}(?![a-z])",
+            rf"(?<![A-Za-z0-9]){word.upper()}(?![A-Za-z])",
+        ]
+    return re.compile("|".join(forms))
+
+
+PROD_RE = _tags("prod", "production", "prd", "live")
+# Stricter, since a non-prod tag lowers the impact: whole name parts only (Dev-App-Role, app_qa, test1, not DevOps)
+NON_PROD_RE = re.compile(
+    r"(?<![A-Za-z])(?:dev|development|test|testing|qa|staging|stage|sandbox|demo)(?![A-Za-z])", re.IGNORECASE
+)
+
+# Resource names inside an action: ARNs and tokens such as Dev-App-Role, s3://bucket or ProdDatabase
+RESOURCE_NAME_RE = re.compile(r"[\w.:/*@-]*(?:[-_/:]|[a-z][A-Z])[\w.:/*@-]*")
+
+
+def parse_diagnosis(text: str) -> Dict[str, str]:
+    """ROOT_CAUSE / SERVICE / CONFIGURATION_ITEM / REQUIRED_ACTION from the diagnosis message."""
+    matches = list(DIAGNOSIS_RE.finditer(text))
+    fields = {}
+    for i, match in enumerate(matches):
+        value = match.group(2).strip()
+        if not value:
+            # Value written on the lines under the label
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            value = " ".join(text[match.end():end].split())
+        # The last occurrence is the final answer
+        fields[match.group(1)] = value.strip("*` ")
+    return fields
+
+
+def classify_action(action: str, configuration_item: str = "", request: str = "") -> Optional[Dict[str, object]]:
+    """
+    reversible / highImpact for `action`, or None when no table row matches.
+    Privileged resources are looked for in the action, the configuration item
+    and the user request; environment tags only in the configuration item and
+    the resource names of the action, never in the request's prose. A prod
+    tag wins over a non-prod one, and an untagged resource is high impact.
+    """
+    for verb_class, pattern, reversible in VERB_TABLE:
+        if pattern.search(action):
+            break
+    else:
+        return None
+
+    names = "\n".join([configuration_item] + RESOURCE_NAME_RE.findall(action))
+    if PRIVILEGED_RESOURCE_RE.search(f"{action}\n{configuration_item}\n{request}"):
+        high_impact, reason = True, "privileged resource"
+    elif PROD_RE.search(names):
+        high_impact, reason = True, "production"
+    elif NON_PROD_RE.search(names):
+        high_impact, reason = False, "non-production"
+    else:
+        high_impact, reason = True, "untagged"
+
+    return {"verb": verb_class, "reversible": reversible, "highImpact": high_impact, "reason": reason}
@@ -1,4 +1,5 @@
 import streamlit as st
+import uuid
 from langgraph.types import Command
 from AWSagent import agent   # import your compiled agent
 
@@ -8,7 +9,8 @@ st.title("🔐 AWS AI Operator")
 
 # Session state
 if "thread_id" not in st.session_state:
-    st.session_state.thread_id = "streamlit-thread"
+    # One thread per browser session so operators never share history
+    st.session_state.thread_id = f"streamlit-{uuid.uuid4().hex}"
 
 if "waiting_for_approval" not in st.session_state:
     st.session_state.waiting_for_approval = False
@@ -1,84 +1,390 @@
 from typing import List, Dict, Any, Optional
-from langchain_huggingface import HuggingFaceEmbeddings
+from embeddingModel import load_embeddings, EMBEDDING_MODEL_ID
+from queryCache import QueryEmbeddingCache
+from lexicalIndex import BM25Index, exact_tokens, reciprocal_rank_fusion
+from ciRouter import ConfigurationItemRouter
+from reranker import rerank, RERANK_TOP_N
+from contextBuilder import build_context, CONTEXT_MAX_CHUNKS
+from chunkStore import attach_text
+from instrumentation import metrics
 from dotenv import load_dotenv
 import numpy as np
-from pinecone import Pinecone
+from vectorStore import open_index
+import asyncio
 import os
-from google import genai
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
 
 load_dotenv()
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-
-
-# llm calling
-def llmout(query, user_guides, tickets):
-    content =   f"""Rank the given user guides data and tickets data from the similarity algorithm which will be the most suitable for the given query.
-                    Query: {query},
-                    User_guides: {user_guides},
-                    tickets: {tickets}.
-                """
-
-    client = genai.Client(api_key = GOOGLE_API_KEY)
-    response = client.models.generate_content(
-        model = "gemini-2.5-flash-lite",
-        contents = content
-    )
-    ranking = response.text
-    # print(ranking)
 
-    content =   f"""Based on the context: {ranking}
-                    Suggest a solution for the query.
-                    query: {query}
-                """
 
-    response = client.models.generate_content(
-        model = "gemini-2.5-flash-lite",
-        contents = content
-    )
-    # print(response.text)
+# ================= RETRIEVAL RUNTIME =================
+
+class RetrievalRuntime:
+    """
+    Process-wide holder for the embedding model and the vector index handle.
+    Both are loaded once (lazily or through warmup) and shared by every RAG call.
+    """
+
+    def __init__(self, embeddings_factory=None, index_factory=None, query_cache=None, model_id: str = EMBEDDING_MODEL_ID):
+        self._embeddings_factory = embeddings_factory or load_embeddings
+        self._index_factory = index_factory or open_index
+        # Model and backend of the query vectors; cached vectors and CI centroids must match it
+        self.model_id = model_id
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache(model_id)
+        self._embeddings = None
+        self._index = None
+        self._lexical: Dict[str, BM25Index] = {}
+        self._router = None
+        self._router_loaded = False
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._load_secs = 0.0
+        self._cold_secs = None
+        self._warm_calls = 0
+        self._warm_total_secs = 0.0
+
+    def _load(self, attr: str, factory):
+        # Double-checked so concurrent RAG calls load each resource only once
+        if getattr(self, attr) is not None:
+            return getattr(self, attr)
+        with self._load_lock:
+            if getattr(self, attr) is None:
+                start = time.perf_counter()
+                setattr(self, attr, factory())
+                self._load_secs += time.perf_counter() - start
+        return getattr(self, attr)
+
+    @property
+    def embeddings(self):
+        return self._load("_embeddings", self._embeddings_factory)
+
+    @property
+    def index(self):
+        return self._load("_index", self._index_factory)
+
+    def lexical(self, namespace: str) -> BM25Index:
+        """BM25 index written by the embedders for `namespace` (empty if none was built)."""
+        if namespace not in self._lexical:
+            with self._load_lock:
+                if namespace not in self._lexical:
+                    self._lexical[namespace] = BM25Index(namespace)
+        return self._lexical[namespace]
+
+    @property
+    def router(self) -> Optional[ConfigurationItemRouter]:
+        """Configuration item router from the ticket ingest (None until centroids exist)."""
+        if not self._router_loaded:
+            with self._load_lock:
+                if not self._router_loaded:
+                    self._router = ConfigurationItemRouter.load(model_id=self.model_id)
+                    self._router_loaded = True
+        return self._router
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query, answering repeats from the cache without touching the model."""
+        vector = self.query_cache.get(query)
+        metrics.record_cache_lookup(vector is not None)
+        if vector is None:
+            with metrics.stage("embed_query"):
+                vector = self.embeddings.embed_query(query)
+            self.query_cache.put(query, vector)
+        return vector
+
+    def warmup(self, query: str = "AssumeRole AccessDenied") -> float:
+        """Load the model and index handle and run one throwaway embedding."""
+        start = time.perf_counter()
+        self._load("_index", self._index_factory)
+        self.embeddings.embed_query(query)
+        return time.perf_counter() - start
+
+    def record_call(self, secs: float):
+        with self._stats_lock:
+            if self._cold_secs is None:
+                self._cold_secs = secs
+            else:
+                self._warm_calls += 1
+                self._warm_total_secs += secs
+
+    def latency_report(self) -> Dict[str, Any]:
+        """Load time, cold and average warm call latency, and query cache counters."""
+        with self._stats_lock:
+            return {
+                "load_secs": self._load_secs,
+                "cold_secs": self._cold_secs,
+                "warm_calls": self._warm_calls,
+                "warm_avg_secs": (
+                    self._warm_total_secs / self._warm_calls if self._warm_calls else None
+                ),
+                "query_cache": self.query_cache.stats(),
+            }
+
+
+_runtime: Optional[RetrievalRuntime] = None
+_runtime_lock = threading.Lock()
 
-    return response.text
 
+def get_runtime() -> RetrievalRuntime:
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = RetrievalRuntime()
+    return _runtime
 
-## Approx ~15-20secs for retrival
-def retrival_argumented_generation(query):
-    embeddings = HuggingFaceEmbeddings(
-        model_name = "sentence-transformers/all-mpnet-base-v2",
+
+def set_runtime(runtime: RetrievalRuntime):
+    """Replace the shared runtime (e.g. to plug in another model or index)."""
+    global _runtime
+    with _runtime_lock:
+        _runtime = runtime
+
+
+def warmup() -> float:
+    secs = get_runtime().warmup()
+    print(f"RAG runtime warmed up in {secs:.2f}s")
+    return secs
+
+
+# ================= RETRIEVAL =================
+
+# Every corpus the RAG tool searches; all of them are queried concurrently
+DEFAULT_NAMESPACES = ["user_guide_docs", "ticket_docs"]
+
+# Fuse dense results with the BM25 index built at ingest time
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+# Candidates each retriever contributes to fusion, per namespace
+FUSION_CANDIDATES = 10
+# Lexical-only answer when the top BM25 hit beats the runner-up by this factor
+LEXICAL_FAST_PATH_MARGIN = float(os.getenv("LEXICAL_FAST_PATH_MARGIN", "1.5"))
+# Restrict ticket search to the configuration items the query routes to
+CI_ROUTING = os.getenv("CI_ROUTING", "1") == "1"
+# Matches fetched per namespace for the reranker to choose from
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "5"))
+
+
+def _match(doc_id, namespace, metadata, score, dense_score=None, lexical_score=None) -> Dict[str, Any]:
+    return {
+        "id": doc_id,
+        "namespace": namespace,
+        "score": score,
+        "dense_score": dense_score,
+        "lexical_score": lexical_score,
+        "metadata": metadata,
+    }
+
+
+def lexical_fast_path(
+    query: str,
+    namespaces: List[str],
+    top_k: int = 3,
+    filters: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Answer from BM25 alone when the query names exact tokens (sts:AssumeRole,
+    AccessDenied) and some namespace has a top hit that contains all of
+    them and clearly beats the runner-up. Never touches the embedding model.
+    """
+    exact = exact_tokens(query)
+    if not exact:
+        return None
+
+    runtime = get_runtime()
+    filters = filters or {}
+    hits = {
+        namespace: runtime.lexical(namespace).search(query, top_k, filters.get(namespace))
+        for namespace in namespaces
+    }
+    confident = any(
+        ranked
+        and runtime.lexical(namespace).contains_all(ranked[0][0], exact)
+        and (len(ranked) == 1 or ranked[0][1] >= LEXICAL_FAST_PATH_MARGIN * ranked[1][1])
+        for namespace, ranked in hits.items()
     )
+    if not confident:
+        return None
+
+    return [
+        _match(doc_id, namespace, runtime.lexical(namespace).metadata(doc_id), score, lexical_score=score)
+        for namespace in namespaces
+        for doc_id, score in hits[namespace]
+    ]
+
 
-    q_emb =  embeddings.embed_query(query)
+def _fuse(namespace: str, dense_matches, lexical_hits, top_k: int) -> List[Dict[str, Any]]:
+    dense = {m["id"]: m for m in dense_matches}
+    lexical = dict(lexical_hits)
+    fused = reciprocal_rank_fusion([
+        [m["id"] for m in dense_matches],
+        [doc_id for doc_id, _ in lexical_hits],
+    ])
+
+    matches = []
+    for doc_id in sorted(fused, key=fused.get, reverse=True)[:top_k]:
+        metadata = dense[doc_id]["metadata"] if doc_id in dense else get_runtime().lexical(namespace).metadata(doc_id)
+        matches.append(_match(
+            doc_id,
+            namespace,
+            metadata,
+            fused[doc_id],
+            dense_score=dense[doc_id]["score"] if doc_id in dense else None,
+            lexical_score=lexical.get(doc_id),
+        ))
+    return matches
+
+
+async def _search_namespace(
+    query: str,
+    query_vector: List[float],
+    namespace: str,
+    top_k: int,
+    hybrid: bool,
+    filter: Optional[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    runtime = get_runtime()
+    candidates = max(top_k, FUSION_CANDIDATES) if hybrid else top_k
+
+    with metrics.stage("vector_query"):
+        response = await asyncio.to_thread(
+            runtime.index.query,
+            vector=query_vector,
+            top_k=candidates,
+            namespace=namespace,
+            include_metadata=True,
+            include_values=False,
+            filter=filter
+        )
+    dense_matches = response["matches"]
+
+    with metrics.stage("lexical_query"):
+        lexical_hits = runtime.lexical(namespace).search(query, candidates, filter) if hybrid else []
+    if lexical_hits:
+        return _fuse(namespace, dense_matches, lexical_hits, top_k)
+    return [
+        _match(match["id"], namespace, match["metadata"], match["score"], dense_score=match["score"])
+        for match in dense_matches[:top_k]
+    ]
+
+
+async def aretrieve(
+    query: str,
+    namespaces: Optional[List[str]] = None,
+    top_k: int = 3,
+    hybrid: bool = HYBRID_RETRIEVAL,
+    filters: Optional[Dict[str, Dict[str, Any]]] = None,
+    route: bool = CI_ROUTING,
+) -> List[Dict[str, Any]]:
+    """
+    Embed the query once and search every namespace concurrently, so total
+    latency is the slowest namespace rather than the sum of all of them.
+    Matches are returned grouped in `namespaces` order.
+
+    With `hybrid`, dense and BM25 rankings are combined by reciprocal-rank
+    fusion, and exact-token queries may be answered by the lexical fast
+    path. "score" is the final ranking score (cosine, RRF or BM25);
+    "dense_score" and "lexical_score" keep the raw per-retriever scores.
+
+    `filters` maps a namespace to a Pinecone-style metadata filter, e.g.
+    {"user_guide_docs": {"section": "Roles"}}. With `route`, the ticket
+    namespace is restricted to the configuration items whose centroids are
+    closest to the query, falling back to the whole namespace when that
+    subset yields fewer than `top_k` matches.
+
+    Chunks ingested with the chunk store get their text attached from it;
+    matches whose metadata already carries "text" are returned as is.
+    """
+    runtime = get_runtime()
+    namespaces = namespaces or DEFAULT_NAMESPACES
+    filters = filters or {}
+
+    if hybrid:
+        fast = lexical_fast_path(query, namespaces, top_k, filters)
+        if fast is not None:
+            return _with_text(fast)
+
+    q_emb = await asyncio.to_thread(runtime.embed_query, query)
     query_vector = np.array(q_emb, dtype=np.float32).tolist()
-    # print(query_vector)
-
-    pc = Pinecone(api_key = f"{PINECONE_API_KEY}")
-    pinecone_index = pc.Index("rag")
-    user_guide_response = pinecone_index.query(
-        vector=query_vector,
-        top_k=3,
-        namespace="user_guide_docs",
-        include_metadata=True,
-        include_values=False
-    )
-    ticket_response = pinecone_index.query(
-        vector=query_vector,
-        top_k=3,
-        namespace="ticket_docs",
-        include_metadata=True,
-        include_values=False
-    )
-    # print(user_guide_response["matches"], ticket_response["matches"])
 
-    user_guides=[]
-    tickets=[]
-    for match in user_guide_response["matches"]:
-        user_guides.append(match["metadata"])
-    for match in ticket_response["matches"]:
-        tickets.append(match["metadata"])
+    routed = {}
+    router = runtime.router if route else None
+    if router is not None and router.namespace in namespaces and router.namespace not in filters:
+        routed_filter = router.filter_for(query_vector)
+        if routed_filter:
+            routed[router.namespace] = routed_filter
+
+    results = await asyncio.gather(*[
+        _search_namespace(query, query_vector, namespace, top_k, hybrid, filters.get(namespace) or routed.get(namespace))
+        for namespace in namespaces
+    ])
+
+    # Routing is only a hint: widen back to the whole namespace when the routed subset is too small
+    retry = [i for i, namespace in enumerate(namespaces) if namespace in routed and len(results[i]) < top_k]
+    if retry:
+        widened = await asyncio.gather(*[
+            _search_namespace(query, query_vector, namespaces[i], top_k, hybrid, None)
+            for i in retry
+        ])
+        for i, matches in zip(retry, widened):
+            results[i] = matches
+
+    return _with_text([match for matches in results for match in matches])
+
+
+def _with_text(matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Chunk text is only read from the chunk store for matches that made the per-namespace cut
+    with metrics.stage("chunk_text"):
+        return attach_text(matches)
+
+
+def retrieve(
+    query: str,
+    namespaces: Optional[List[str]] = None,
+    top_k: int = 3,
+    hybrid: bool = HYBRID_RETRIEVAL,
+    filters: Optional[Dict[str, Dict[str, Any]]] = None,
+    route: bool = CI_ROUTING,
+) -> List[Dict[str, Any]]:
+    """Sync wrapper around aretrieve that is also safe to call from inside a running event loop."""
+    args = (query, namespaces, top_k, hybrid, filters, route)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(aretrieve(*args))
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, aretrieve(*args)).result()
+
+
+def retrieve_ranked(query, top_n: int = RERANK_TOP_N) -> List[Dict[str, Any]]:
+    runtime = get_runtime()
+    start = time.perf_counter()
+
+    # Over-fetch per namespace, then keep only the best top_n overall
+    candidates = retrieve(query, top_k=RERANK_CANDIDATES)
+    with metrics.stage("rerank"):
+        matches = rerank(query, candidates, top_n=top_n)
+
+    secs = time.perf_counter() - start
+    runtime.record_call(secs)
+    metrics.record_retrieval(secs, len(matches))
+    return matches
+
+
+## Was ~15-20secs per call while the model was reloaded every time
+def retrival_argumented_generation(query, top_n: int = RERANK_TOP_N):
+    matches = retrieve_ranked(query, top_n=top_n)
+    # print(matches)
+
+    return [m["metadata"] for m in matches]
 
-    #Uncomment if running alone for RAG
-    # llm_output = llmout(query, user_guides, tickets)
 
-    return user_guides+tickets
+def rag_context(query) -> str:
+    """De-duplicated, budgeted context for the RAG tool"""
+    matches = retrieve_ranked(query, top_n=CONTEXT_MAX_CHUNKS)
+    with metrics.stage("context_build"):
+        context, stats = build_context(matches)
+    # print(stats)
+    return context
 
-# retrival_argumented_generation("Why is AssumeRole failing?")
\ No newline at end of file
+# retrival_argumented_generation("Why is AssumeRole failing?")
@@ -0,0 +1,179 @@
+from typing import Any, Dict, Iterator, List, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import argparse
+import json
+import threading
+import time
+import uuid
+import numpy as np
+from langgraph.types import Command
+
+# --------------------------------------------------
+# HEADLESS BATCH RUNNER
+# Streams requests from a JSONL file through the compiled agent, one
+# thread per request, and writes one JSONL result per request as soon as
+# it finishes. High-impact interrupts are approved, rejected or queued
+# (left paused on their thread, to be resumed later with --resume; this
+# needs the default sqlite checkpointer so paused threads survive the run).
+#
+#   python batchRunner.py tickets.jsonl -o results.jsonl --workers 4 --interrupts queue
+#   python batchRunner.py results.jsonl --resume --decision approve -o resumed.jsonl
+# --------------------------------------------------
+
+INTERRUPT_POLICIES = ("approve", "reject", "queue")
+MESSAGE_FIELDS = ("message", "query", "content", "body", "text")
+ID_FIELDS = ("request_id", "id", "ticket_id")
+
+
+def read_requests(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"message": record}
+            request_id = next((record[k] for k in ID_FIELDS if record.get(k) is not None), line_no)
+            yield {**record, "request_id": str(request_id)}
+
+
+def _message(record: Dict[str, Any]) -> str:
+    for field in MESSAGE_FIELDS:
+        if record.get(field):
+            return str(record[field])
+    raise ValueError(f"Request {record['request_id']} has none of the fields {MESSAGE_FIELDS}")
+
+
+def _result(record, thread_id, state, interrupts, start) -> Dict[str, Any]:
+    messages = state.get("messages", [])
+    pending = state.get("__interrupt__")
+    result = {
+        "request_id": record["request_id"],
+        "thread_id": thread_id,
+        "status": "pending_approval" if pending else "ok",
+        "response": messages[-1].content if messages and not pending else None,
+        "tool_outputs": [m.content for m in messages if m.type == "tool"],
+        "interrupts": interrupts,
+        "latency": round(time.perf_counter() - start, 4),
+    }
+    if pending:
+        result["interrupt"] = [getattr(i, "value", str(i)) for i in pending]
+    return result
+
+
+def run_request(agent, record: Dict[str, Any], policy: str, run_id: str, decision: Optional[str] = None) -> Dict[str, Any]:
+    """Run (or, with `decision`, resume) one request to completion or to a queued interrupt."""
+    start = time.perf_counter()
+    thread_id = record.get("thread_id") if decision else f"batch-{run_id}-{record['request_id']}"
+    config = {"configurable": {"thread_id": thread_id}}
+    interrupts = 0
+    try:
+        if decision:
+            state = agent.invoke(Command(resume={"decision": decision}), config=config)
+            interrupts += 1
+        else:
+            state = agent.invoke({"messages": [{"role": "user", "content": _message(record)}]}, config=config)
+
+        while "__interrupt__" in state and policy != "queue":
+            interrupts += 1
+            state = agent.invoke(Command(resume={"decision": policy}), config=config)
+
+        return _result(record, thread_id, state, interrupts, start)
+    except Exception as e:
+        return {
+            "request_id": record["request_id"],
+            "thread_id": thread_id,
+            "status": "error",
+            "error": f"{type(e).__name__}: {e}",
+            "interrupts": interrupts,
+            "latency": round(time.perf_counter() - start, 4),
+        }
+
+
+def latency_report(results: List[Dict[str, Any]], wall_time: float) -> Dict[str, Any]:
+    latencies = np.asarray([r["latency"] for r in results], dtype=np.float64)
+    report = {
+        "requests": len(results),
+        "ok": sum(r["status"] == "ok" for r in results),
+        "pending_approval": sum(r["status"] == "pending_approval" for r in results),
+        "errors": sum(r["status"] == "error" for r in results),
+        "wall_time": round(wall_time, 3),
+        "throughput_rps": round(len(results) / wall_time, 3) if wall_time else None,
+    }
+    for q in (50, 95, 99):
+        report[f"p{q}"] = round(float(np.percentile(latencies, q)), 4) if len(latencies) else None
+    return report
+
+
+def run_batch(
+    agent,
+    records: Iterator[Dict[str, Any]],
+    output_path: str,
+    workers: int = 4,
+    policy: str = "queue",
+    decision: Optional[str] = None,
+) -> Dict[str, Any]:
+    run_id = uuid.uuid4().hex[:8]
+    results: List[Dict[str, Any]] = []
+    write_lock = threading.Lock()
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        def write(result):
+            with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+                results.append(result)
+            print(f"[{len(results)}] {result['request_id']}: {result['status']} in {result['latency']:.2f}s")
+
+        # Only a couple of requests per worker are read ahead, so huge files stream
+        pending = set()
+        for record in records:
+            pending.add(pool.submit(run_request, agent, record, policy, run_id, decision))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+        for future in pending:
+            write(future.result())
+
+    report = latency_report(results, time.perf_counter() - start)
+    print(json.dumps(report, indent=2))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of requests through the AWS agent.")
+    parser.add_argument("input", help="JSONL requests, or a previous results file with --resume")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL results, appended as they finish")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="requests in flight at once")
+    parser.add_argument("--interrupts", choices=INTERRUPT_POLICIES, default="queue",
+                        help="approve / reject high-impact actions, or queue them for a later --resume")
+    parser.add_argument("--resume", action="store_true", help="resume the pending_approval entries of a results file")
+    parser.add_argument("--decision", choices=("approve", "reject"), default="reject", help="decision applied with --resume")
+    parser.add_argument("--report", help="also write the throughput / latency report to this JSON file")
+    args = parser.parse_args(argv)
+
+    # Imported here so --help works without loading the models
+    from AWSagent import agent
+
+    records = read_requests(args.input)
+    if args.resume:
+        records = (r for r in records if r.get("status") == "pending_approval")
+
+    report = run_batch(
+        agent,
+        records,
+        args.output,
+        workers=args.workers,
+        policy=args.interrupts,
+        decision=args.decision if args.resume else None,
+    )
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
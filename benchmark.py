@@ -0,0 +1,447 @@
+from typing import Any, Callable, Dict, List, Optional
+from collections import defaultdict
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import numpy as np
+
+# --------------------------------------------------
+# OFFLINE END-TO-END BENCHMARK
+# Runs ingestion and the compiled AWSagent graph with deterministic
+# stand-ins: a scripted chat model in place of Ollama, hashed bag-of-words
+# embeddings in place of the sentence-transformer, and the local index in
+# place of Pinecone, each with configurable injected latency. Every stage
+# is timed and the results are written as JSON so runs can be compared
+# between commits.
+#
+#   python benchmark.py --requests 30 --llm-latency 0.5 -o bench.json
+# --------------------------------------------------
+
+DEFAULT_PDF = "data/pdf/AWSecsUserGuide_modified.pdf"
+DEFAULT_TICKETS = "data/text_files/IAMtickets.json"
+FAKE_EMBEDDING_DIM = 768
+
+# (request, diagnosis the scripted model answers with); they cover an
+# executed change, a high-impact change needing approval and a blocked one
+SCENARIOS = [
+    (
+        "Users are getting AccessDenied when trying to assume an IAM role from EC2. "
+        "The error mentions sts:AssumeRole on role Dev-App-Role.",
+        "ROOT_CAUSE: Trust policy does not include the calling principal\n"
+        "SERVICE: IAM\n"
+        "CONFIGURATION_ITEM: IAM Role Trust Policy\n"
+        "REQUIRED_ACTION: Add the EC2 instance role principal to the trust policy of Dev-App-Role",
+    ),
+    (
+        "ECS tasks of service Prod-Web-Service stop with CannotPullContainerError: "
+        "not authorized to perform ecr:BatchGetImage.",
+        "ROOT_CAUSE: Task execution role cannot pull from ECR\n"
+        "SERVICE: ECS\n"
+        "CONFIGURATION_ITEM: Task execution role\n"
+        "REQUIRED_ACTION: Attach AmazonEC2ContainerRegistryReadOnly to the task execution role of Prod-Web-Service",
+    ),
+    (
+        "We no longer need the IAM user contractor-temp-user. Permanently delete this user.",
+        "ROOT_CAUSE: Unused contractor identity\n"
+        "SERVICE: IAM\n"
+        "CONFIGURATION_ITEM: IAM User\n"
+        "REQUIRED_ACTION: Permanently delete IAM user contractor-temp-user",
+    ),
+]
+
+
+class StageTimer:
+    """Thread-safe collection of wall times per stage."""
+
+    def __init__(self):
+        self._times: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+        # Prepended to every stage name, so runs of different configurations are reported apart
+        self.prefix = ""
+
+    def record(self, stage: str, secs: float):
+        with self._lock:
+            self._times[self.prefix + stage].append(secs)
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            times = {stage: np.asarray(values) for stage, values in self._times.items()}
+        return {
+            stage: {
+                "count": int(len(values)),
+                "total": round(float(values.sum()), 6),
+                "mean": round(float(values.mean()), 6),
+                "p50": round(float(np.percentile(values, 50)), 6),
+                "p95": round(float(np.percentile(values, 95)), 6),
+                "max": round(float(values.max()), 6),
+            }
+            for stage, values in sorted(times.items())
+        }
+
+
+class FakeEmbeddings:
+    """Deterministic hashed bag-of-words vectors with the embed_query / embed_documents interface."""
+
+    def __init__(self, dim: int = FAKE_EMBEDDING_DIM, latency: float = 0.0, per_text_latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+
+    def _vector(self, text: str) -> List[float]:
+        from lexicalIndex import tokenize
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency + self.per_text_latency)
+        return self._vector(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._vector(t) for t in texts]
+
+
+class LatencyIndex:
+    """Wraps an index and sleeps before every query / upsert, like a remote service would."""
+
+    def __init__(self, index, query_latency: float = 0.0, upsert_latency: float = 0.0, timer: Optional[StageTimer] = None):
+        self._index = index
+        self.query_latency = query_latency
+        self.upsert_latency = upsert_latency
+        self.timer = timer or StageTimer()
+
+    def query(self, *args, **kwargs):
+        start = time.perf_counter()
+        time.sleep(self.query_latency)
+        result = self._index.query(*args, **kwargs)
+        self.timer.record("vector_query", time.perf_counter() - start)
+        return result
+
+    def upsert(self, *args, **kwargs):
+        start = time.perf_counter()
+        time.sleep(self.upsert_latency)
+        result = self._index.upsert(*args, **kwargs)
+        self.timer.record("ingest_upsert_batch", time.perf_counter() - start)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._index, name)
+
+
+def make_fake_chat_model(
+    timer: StageTimer,
+    diagnoses: Dict[str, str],
+    latency: float = 0.0,
+    prefill_latency_per_1k: float = 0.0,
+):
+    """Scripted chat model: the system prompt decides the role, the role decides the answer."""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+    from actionPolicy import parse_diagnosis
+    from prompts import RAG_planner_prompt1, RAG_agent_prompt1, OPERATOR_agent_prompt1, FINAL_reponse_prompt1
+
+    roles = {
+        RAG_planner_prompt1: "planner",
+        RAG_agent_prompt1: "diagnosis",
+        OPERATOR_agent_prompt1: "operator",
+        FINAL_reponse_prompt1: "final_response",
+    }
+
+    class ScriptedChatModel(BaseChatModel):
+        call_count: int = 0
+
+        @property
+        def _llm_type(self) -> str:
+            return "scripted-benchmark"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            role = roles.get(messages[0].content, "unknown")
+            request = next((m.content for m in messages if isinstance(m, HumanMessage)), "")
+            prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+
+            start = time.perf_counter()
+            time.sleep(latency + prefill_latency_per_1k * prompt_tokens / 1000)
+
+            if role == "planner":
+                message = AIMessage(content="", tool_calls=[
+                    {"name": "RAG", "args": {"query": request}, "id": f"rag_{self.call_count}"}
+                ])
+            elif role == "diagnosis":
+                message = AIMessage(content=diagnoses.get(request, SCENARIOS[0][1]))
+            elif role == "operator":
+                diagnosis = parse_diagnosis(str(messages[-1].content))
+                message = AIMessage(content="", tool_calls=[{
+                    "name": "AWSTool",
+                    "args": {
+                        "service": diagnosis.get("SERVICE", "IAM"),
+                        "configuration_item": diagnosis.get("CONFIGURATION_ITEM", ""),
+                        "action": diagnosis.get("REQUIRED_ACTION", ""),
+                        "reversible": True,
+                        "highImpact": False,
+                    },
+                    "id": f"op_{self.call_count}",
+                }])
+            else:
+                message = AIMessage(content="The issue was diagnosed and the corrective action was handled.")
+
+            message.usage_metadata = {
+                "input_tokens": prompt_tokens,
+                "output_tokens": len(str(message.content)) // 4 + 1,
+                "total_tokens": prompt_tokens + len(str(message.content)) // 4 + 1,
+            }
+            self.call_count += 1
+            timer.record(f"llm_{role}", time.perf_counter() - start)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    return ScriptedChatModel()
+
+
+def bench_ingestion(args, timer: StageTimer, embeddings: FakeEmbeddings, index) -> Dict[str, Any]:
+    from embedTickets import lexical_text as ticket_lexical_text, to_documents_per_object
+    from embedUserGuides import PDFSectionChunker, clean_metadata
+    from ingestPipeline import ingest_documents, Manifest
+    from ciRouter import build_centroids
+
+    def make_metadata(doc):
+        return clean_metadata({"text": doc.page_content, **doc.metadata})
+
+    embeddings.embed_documents = timer.wrap("ingest_embed_batch", embeddings.embed_documents)
+    results = {}
+
+    # PDF: a cold pass parses and chunks, the warm pass chunks from the layout cache
+    chunker = PDFSectionChunker(chunk_size=1000, chunk_overlap=150, cache_dir=os.path.join(args.workdir, "layout"))
+    start = time.perf_counter()
+    chunks = chunker.process_pdf(args.pdf, workers=args.pdf_workers)
+    timer.record("ingest_pdf_parse_chunk", time.perf_counter() - start)
+    start = time.perf_counter()
+    chunks = chunker.process_pdf(args.pdf, workers=args.pdf_workers)
+    timer.record("ingest_pdf_chunk_cached", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results["user_guide_docs"] = ingest_documents(
+        chunks,
+        namespace="user_guide_docs",
+        source=os.path.basename(args.pdf),
+        id_prefix="user_guide_doc",
+        make_metadata=make_metadata,
+        index=index,
+        lexical_text=lambda doc: doc.page_content,
+        workers=1,
+        embeddings=embeddings,
+    )
+    timer.record("ingest_embed_upsert_pdf", time.perf_counter() - start)
+    results["user_guide_docs"]["chunks"] = len(chunks)
+
+    with open(args.tickets, "r", encoding="utf-8") as f:
+        tickets = to_documents_per_object(json.load(f), source=os.path.basename(args.tickets))
+    start = time.perf_counter()
+    results["ticket_docs"] = ingest_documents(
+        tickets,
+        namespace="ticket_docs",
+        source=os.path.basename(args.tickets),
+        id_prefix="ticket_doc",
+        make_metadata=make_metadata,
+        index=index,
+        lexical_text=ticket_lexical_text,
+        workers=1,
+        embeddings=embeddings,
+    )
+    build_centroids(index, "ticket_docs", Manifest("ticket_docs").all_ids(), model_name="benchmark-hashed-bow")
+    timer.record("ingest_embed_upsert_tickets", time.perf_counter() - start)
+    results["ticket_docs"]["chunks"] = len(tickets)
+    return results
+
+
+def bench_agent(args, timer: StageTimer, embeddings: FakeEmbeddings, index) -> Dict[str, Any]:
+    import awsRAG
+    import AWSagent
+    from awsRAG import RetrievalRuntime, set_runtime
+    from queryCache import QueryEmbeddingCache
+    from langchain_core.messages import HumanMessage
+    from langgraph.types import Command
+
+    # Stage probes on the module globals the graph calls through
+    awsRAG.rerank = timer.wrap("rerank", awsRAG.rerank)
+    awsRAG.build_context = timer.wrap("context_build", awsRAG.build_context)
+    AWSagent.rag_context = timer.wrap("rag_tool", AWSagent.rag_context)
+
+    model = make_fake_chat_model(
+        timer,
+        diagnoses=dict(SCENARIOS),
+        latency=args.llm_latency,
+        prefill_latency_per_1k=args.prefill_latency,
+    )
+    AWSagent.model = model
+    AWSagent.rag_model = model.bind_tools([AWSagent.RAG])
+    AWSagent.operator_model = model.bind_tools([AWSagent.AWSTool])
+    agent = AWSagent.get_agent()
+
+    def run(payload, config):
+        # Time between streamed updates is the wall time of the node that produced them
+        state_interrupted = False
+        last = time.perf_counter()
+        for update in agent.stream(payload, config=config, stream_mode="updates"):
+            now = time.perf_counter()
+            for node in update:
+                if node == "__interrupt__":
+                    state_interrupted = True
+                else:
+                    timer.record(f"node_{node}", now - last)
+            last = now
+        return state_interrupted
+
+    def run_requests(operator: str) -> Dict[str, Any]:
+        runtime = RetrievalRuntime(
+            embeddings_factory=lambda: embeddings,
+            index_factory=lambda: index,
+            query_cache=QueryEmbeddingCache("benchmark-hashed-bow", path=None),
+            model_id="benchmark-hashed-bow",
+        )
+        runtime.embed_query = timer.wrap("query_embedding", runtime.embed_query)
+        set_runtime(runtime)
+        llm_calls = model.call_count
+
+        totals = []
+        outcomes = defaultdict(int)
+        for i in range(args.requests):
+            request = SCENARIOS[i % len(SCENARIOS)][0]
+            config = {"configurable": {"thread_id": f"bench-{operator}-{i}"}}
+            start = time.perf_counter()
+            interrupted = run({"messages": [HumanMessage(content=request)]}, config)
+            if interrupted:
+                outcomes["interrupted"] += 1
+                resume_start = time.perf_counter()
+                run(Command(resume={"decision": "approve"}), config)
+                timer.record("approval_resume", time.perf_counter() - resume_start)
+            total = time.perf_counter() - start
+            timer.record("request_total", total)
+            totals.append(total)
+            outcomes["completed"] += 1
+
+        wall = sum(totals)
+        return {
+            "requests": args.requests,
+            "outcomes": dict(outcomes),
+            "throughput_rps": round(args.requests / wall, 3) if wall else None,
+            "llm_calls": model.call_count - llm_calls,
+            "retrieval": runtime.latency_report(),
+        }
+
+    # The policy table and the operator LLM are timed separately; their stages are prefixed "policy:" / "llm:"
+    results = {}
+    for operator in (("policy", "llm") if args.operator == "both" else (args.operator,)):
+        AWSagent.OPERATOR_POLICY = operator == "policy"
+        timer.prefix = f"{operator}:"
+        try:
+            results[operator] = run_requests(operator)
+        finally:
+            timer.prefix = ""
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of ingestion and the agent graph.")
+    parser.add_argument("--pdf", default=DEFAULT_PDF)
+    parser.add_argument("--tickets", default=DEFAULT_TICKETS)
+    parser.add_argument("--requests", type=int, default=15, help="agent requests, cycling through the scenarios")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per chat model call")
+    parser.add_argument("--prefill-latency", type=float, default=0.0, help="extra seconds per 1k prompt tokens")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per embedding call")
+    parser.add_argument("--embed-text-latency", type=float, default=0.0, help="extra seconds per embedded text")
+    parser.add_argument("--query-latency", type=float, default=0.0, help="seconds per vector index query")
+    parser.add_argument("--upsert-latency", type=float, default=0.0, help="seconds per vector index upsert batch")
+    parser.add_argument("--pdf-workers", type=int, default=1)
+    parser.add_argument(
+        "--operator", choices=("policy", "llm", "both"), default="both",
+        help="operator stage: the action policy table, the operator LLM, or each in turn",
+    )
+    parser.add_argument("--workdir", help="scratch directory for indexes and caches (default: a temp dir, removed after)")
+    parser.add_argument("--skip-ingestion", action="store_true", help="reuse the indexes already in --workdir")
+    parser.add_argument("-o", "--output", help="write the JSON results here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    args.pdf = os.path.abspath(args.pdf)
+    args.tickets = os.path.abspath(args.tickets)
+    keep_workdir = args.workdir is not None
+    args.workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="rag-benchmark-"))
+
+    # Every on-disk store goes to the scratch directory; the repo modules read these at import
+    os.environ.update({
+        "LOCAL_INDEX_DIR": os.path.join(args.workdir, "vector_index"),
+        "LEXICAL_INDEX_DIR": os.path.join(args.workdir, "lexical_index"),
+        "CHUNK_STORE_DIR": os.path.join(args.workdir, "chunk_store"),
+        "INGEST_MANIFEST_DIR": os.path.join(args.workdir, "manifests"),
+        "CI_CENTROIDS_PATH": os.path.join(args.workdir, "ci_centroids.json"),
+        "CHECKPOINT_DB_PATH": os.path.join(args.workdir, "checkpoints.sqlite"),
+        "QUERY_CACHE_PATH": "",
+        "VECTOR_BACKEND": "local",
+    })
+
+    from localIndex import LocalIndex
+
+    timer = StageTimer()
+    embeddings = FakeEmbeddings(latency=args.embed_latency, per_text_latency=args.embed_text_latency)
+    index = LatencyIndex(
+        LocalIndex(os.environ["LOCAL_INDEX_DIR"]),
+        query_latency=args.query_latency,
+        upsert_latency=args.upsert_latency,
+        timer=timer,
+    )
+
+    try:
+        results = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output",)},
+        }
+        if not args.skip_ingestion:
+            results["ingestion"] = bench_ingestion(args, timer, embeddings, index)
+        results["agent"] = bench_agent(args, timer, embeddings, index)
+        results["stages"] = timer.summary()
+    finally:
+        if not keep_workdir:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2, default=str)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
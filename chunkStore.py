@@ -0,0 +1,222 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import mmap
+import os
+import threading
+
+from vectorStore import VECTOR_BACKEND
+
+# --------------------------------------------------
+# CHUNK TEXT STORE
+# Chunk text lives here instead of in vector metadata: an append-only
+# UTF-8 blob per namespace plus a JSON offset index. Reads decode straight
+# out of a memory map, so only the chunks that survive ranking are ever
+# materialised as Python strings.
+# --------------------------------------------------
+
+# Write chunk text to the store at ingest and leave it out of vector metadata. On by
+# default only with the local index: Pinecone vectors keep their text for hosts without the store
+CHUNK_STORE = os.getenv("CHUNK_STORE", "1" if VECTOR_BACKEND == "local" else "0") == "1"
+CHUNK_STORE_DIR = os.getenv("CHUNK_STORE_DIR", "data/chunk_store")
+
+# Compaction writes the next generation's blob, so readers never see offsets and blob disagree
+BLOB_FILE = "chunks.{}.bin"
+INDEX_FILE = "index.json"
+
+# Rewrite the blob once removed chunks take up more than this share of it
+COMPACT_DEAD_RATIO = 0.5
+
+
+class ChunkStore:
+    def __init__(self, namespace: str, directory: str = CHUNK_STORE_DIR):
+        self.path = os.path.join(directory, namespace or "__default__")
+        self.lock = threading.RLock()
+        # id -> (offset, length) in the blob
+        self.entries: Dict[str, Tuple[int, int]] = {}
+        self.dead_bytes = 0
+        self.generation = 0
+        self._index_mtime = None
+        self._writer = None
+        self._map = None
+        self._mapped_size = 0
+        self._load()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # -------------------- persistence --------------------
+
+    def _load(self):
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.entries = {doc_id: tuple(entry) for doc_id, entry in index["entries"].items()}
+        self.dead_bytes = index.get("dead_bytes", 0)
+        self.generation = index.get("generation", 0)
+        self._index_mtime = os.path.getmtime(index_path)
+        self._unmap()
+
+    def _refresh(self) -> bool:
+        """Pick up chunks another process (an ingest run) has saved since we loaded."""
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_path) and os.path.getmtime(index_path) != self._index_mtime:
+            self._load()
+            return True
+        return False
+
+    def _blob_path(self, generation: Optional[int] = None) -> str:
+        return os.path.join(self.path, BLOB_FILE.format(self.generation if generation is None else generation))
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+        self._map, self._mapped_size = None, 0
+
+    def _view(self, end: int) -> Optional[memoryview]:
+        # Remap when the blob has grown past the mapped length
+        if self._map is None or end > self._mapped_size:
+            self._unmap()
+            blob_path = self._blob_path()
+            size = os.path.getsize(blob_path) if os.path.exists(blob_path) else 0
+            # An empty file cannot be mapped
+            if size == 0 or size < end:
+                return None
+            with open(blob_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_size = len(self._map)
+        return memoryview(self._map)
+
+    def save(self):
+        with self.lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            old_blob = None
+            live_bytes = sum(length for _, length in self.entries.values())
+            if self.dead_bytes and self.dead_bytes > COMPACT_DEAD_RATIO * (live_bytes + self.dead_bytes):
+                old_blob = self._blob_path()
+                self._compact()
+
+            os.makedirs(self.path, exist_ok=True)
+            index_path = os.path.join(self.path, INDEX_FILE)
+            tmp_path = index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"generation": self.generation, "entries": self.entries, "dead_bytes": self.dead_bytes}, f)
+            os.replace(tmp_path, index_path)
+            self._index_mtime = os.path.getmtime(index_path)
+
+            if old_blob is not None:
+                try:
+                    os.remove(old_blob)
+                except OSError:
+                    # Still mapped by a reader on Windows; the next compaction is not blocked by it
+                    pass
+
+    def _compact(self):
+        """Copy the live chunks into the next generation's blob."""
+        entries = {}
+        view = self._view(max((o + n for o, n in self.entries.values()), default=0))
+        with open(self._blob_path(self.generation + 1), "wb") as out:
+            for doc_id, (offset, length) in sorted(self.entries.items(), key=lambda e: e[1][0]):
+                entries[doc_id] = (out.tell(), length)
+                out.write(view[offset:offset + length])
+        if view is not None:
+            view.release()
+        self._unmap()
+        self.entries, self.dead_bytes = entries, 0
+        self.generation += 1
+
+    # -------------------- writes --------------------
+
+    def add(self, doc_id: str, text: str):
+        """Append `text` under `doc_id`; ids are content hashes, so a known id is left as is."""
+        with self.lock:
+            if doc_id in self.entries:
+                return
+            if self._writer is None:
+                os.makedirs(self.path, exist_ok=True)
+                self._writer = open(self._blob_path(), "ab")
+            data = text.encode("utf-8")
+            self.entries[doc_id] = (self._writer.tell(), len(data))
+            self._writer.write(data)
+
+    def remove(self, doc_id: str):
+        with self.lock:
+            entry = self.entries.pop(doc_id, None)
+            if entry is not None:
+                self.dead_bytes += entry[1]
+
+    # -------------------- reads --------------------
+
+    def get(self, doc_id: str) -> Optional[str]:
+        return self.get_many([doc_id]).get(doc_id)
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, str]:
+        with self.lock:
+            ids = list(ids)
+            if self._writer is not None:
+                self._writer.flush()
+            texts = self._read(ids)
+            # Missing ids or a compacted blob: reload the index once and retry
+            if len(texts) < len(ids) and self._refresh():
+                texts = self._read(ids)
+            return texts
+
+    def _read(self, ids: List[str]) -> Dict[str, str]:
+        found = [(doc_id, self.entries[doc_id]) for doc_id in ids if doc_id in self.entries]
+        if not found:
+            return {}
+        view = self._view(max(offset + length for _, (offset, length) in found))
+        if view is None:
+            return {}
+        try:
+            # Decoded straight from the map, without an intermediate bytes copy
+            return {doc_id: str(view[offset:offset + length], "utf-8") for doc_id, (offset, length) in found}
+        finally:
+            view.release()
+
+
+_stores: Dict[Tuple[str, str], ChunkStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(namespace: str, directory: str = CHUNK_STORE_DIR) -> ChunkStore:
+    """Shared store per namespace, so readers in one process map each blob once."""
+    key = (directory, namespace)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ChunkStore(namespace, directory)
+        return _stores[key]
+
+
+def attach_text(matches: List[dict], store_for=open_store) -> List[dict]:
+    """
+    Fill in metadata["text"] for matches whose metadata has none (chunks ingested
+    with the chunk store). Older vectors that still carry their text are left as is.
+    Raises LookupError for chunks the store does not hold, rather than handing
+    blank context to the agent.
+    """
+    missing: Dict[str, List[dict]] = {}
+    for match in matches:
+        if "text" not in (match.get("metadata") or {}):
+            missing.setdefault(match["namespace"], []).append(match)
+
+    for namespace, namespace_matches in missing.items():
+        store = store_for(namespace)
+        texts = store.get_many(m["id"] for m in namespace_matches)
+        unknown = [m["id"] for m in namespace_matches if m["id"] not in texts]
+        if unknown:
+            raise LookupError(
+                f"No chunk text for {len(unknown)} match(es) in namespace {namespace!r} "
+                f"(e.g. {unknown[0]}) in {store.path}; re-ingest on this host, "
+                "or ingest with CHUNK_STORE=0 to keep text in the vector metadata"
+            )
+        for match in namespace_matches:
+            # A copy: the index and BM25 hand out their own metadata dicts
+            match["metadata"] = {**(match.get("metadata") or {}), "text": texts[match["id"]]}
+    return matches
@@ -0,0 +1,111 @@
+from typing import Any, Dict, Iterable, List, Optional
+import json
+import os
+import numpy as np
+
+# --------------------------------------------------
+# CONFIGURATION ITEM ROUTER
+# One centroid per ticket configuration_item (e.g. "IAM Role Trust Policy"),
+# computed at ingest time. At query time the query vector is matched
+# against the centroids and ticket search is restricted to the closest CIs.
+# --------------------------------------------------
+
+CI_CENTROIDS_PATH = os.getenv("CI_CENTROIDS_PATH", "data/ci_centroids.json")
+ROUTED_FIELD = "configuration_item"
+
+# Route to at most this many CIs, and only to those scoring within
+# CI_ROUTE_MARGIN of the best one and above CI_ROUTE_MIN_SCORE
+CI_ROUTE_MAX_ITEMS = int(os.getenv("CI_ROUTE_MAX_ITEMS", "2"))
+CI_ROUTE_MARGIN = float(os.getenv("CI_ROUTE_MARGIN", "0.05"))
+CI_ROUTE_MIN_SCORE = float(os.getenv("CI_ROUTE_MIN_SCORE", "0.3"))
+
+FETCH_BATCH_SIZE = 100
+
+
+def _fetched_vectors(response) -> Dict[str, Any]:
+    # LocalIndex returns plain dicts, the Pinecone client returns model objects
+    return response["vectors"] if isinstance(response, dict) else response.vectors
+
+
+def _field(vector, name: str):
+    return vector[name] if isinstance(vector, dict) else getattr(vector, name)
+
+
+def build_centroids(index, namespace: str, ids: Iterable[str], model_name: str, path: str = CI_CENTROIDS_PATH) -> Dict[str, int]:
+    """Fetch the stored vectors of `ids` and write one normalised mean per configuration item."""
+    ids = sorted(ids)
+    sums: Dict[str, np.ndarray] = {}
+    counts: Dict[str, int] = {}
+
+    for start in range(0, len(ids), FETCH_BATCH_SIZE):
+        response = index.fetch(ids=ids[start:start + FETCH_BATCH_SIZE], namespace=namespace)
+        for vector in _fetched_vectors(response).values():
+            ci = (_field(vector, "metadata") or {}).get(ROUTED_FIELD)
+            if not ci:
+                continue
+            values = np.asarray(_field(vector, "values"), dtype=np.float32)
+            values /= np.linalg.norm(values) or 1.0
+            sums[ci] = sums.get(ci, 0) + values
+            counts[ci] = counts.get(ci, 0) + 1
+
+    centroids = {
+        ci: (total / (np.linalg.norm(total) or 1.0)).tolist()
+        for ci, total in sums.items()
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "namespace": namespace, "counts": counts, "centroids": centroids}, f)
+    print(f"Wrote {len(centroids)} configuration item centroids to {path}")
+    return counts
+
+
+class ConfigurationItemRouter:
+    def __init__(self, path: str = CI_CENTROIDS_PATH):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.model_name = data["model"]
+        self.namespace = data["namespace"]
+        self.items: List[str] = list(data["centroids"])
+        self.centroids = np.asarray([data["centroids"][ci] for ci in self.items], dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str = CI_CENTROIDS_PATH, model_id: Optional[str] = None) -> Optional["ConfigurationItemRouter"]:
+        """
+        The saved router, or None when there is none or its centroids were built
+        with another embedding model / backend than `model_id`: their vector
+        space would not match the query vectors.
+        """
+        if not os.path.exists(path):
+            return None
+        router = cls(path)
+        if model_id is not None and router.model_name != model_id:
+            print(
+                f"Configuration item routing disabled: {path} was built with {router.model_name!r}, "
+                f"queries are embedded with {model_id!r}. Re-run the ticket embedder to rebuild it."
+            )
+            return None
+        return router
+
+    def route(
+        self,
+        query_vector,
+        max_items: int = CI_ROUTE_MAX_ITEMS,
+        margin: float = CI_ROUTE_MARGIN,
+        min_score: float = CI_ROUTE_MIN_SCORE,
+    ) -> List[str]:
+        """Configuration items most likely to hold the answer, best first."""
+        if not self.items:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        scores = self.centroids @ (query / (np.linalg.norm(query) or 1.0))
+        order = np.argsort(-scores)
+        best = scores[order[0]]
+        return [
+            self.items[i]
+            for i in order[:max_items]
+            if scores[i] >= min_score and scores[i] >= best - margin
+        ]
+
+    def filter_for(self, query_vector) -> Optional[Dict[str, Any]]:
+        items = self.route(query_vector)
+        return {ROUTED_FIELD: {"$in": items}} if items else None
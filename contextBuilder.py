@@ -0,0 +1,150 @@
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import re
+
+# --------------------------------------------------
+# RAG CONTEXT BUILDER
+# Turns ranked matches into the prompt context of the RAG tool: weak matches
+# are dropped, chunks of the same section are merged once, the repeated
+# Section/Subsection headers and chunk overlaps are removed, and the result
+# is cut to a token budget so the local model has less to prefill.
+# --------------------------------------------------
+
+# Matches whose dense cosine is below this are not relevant enough to send
+CONTEXT_MIN_SCORE = float(os.getenv("CONTEXT_MIN_SCORE", "0.3"))
+# Adaptive k: keep matches within this gap of the best score (rerank score or, with
+# RERANKER=none, dense cosine; both on a [0, 1] scale)
+CONTEXT_SCORE_GAP = float(os.getenv("CONTEXT_SCORE_GAP", "0.15"))
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "5"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+
+# Chunks are split with a 150 character overlap; look a bit further back
+OVERLAP_SEARCH_CHARS = 400
+# Shorter shared spans are coincidence, not chunk overlap
+MIN_OVERLAP_CHARS = 20
+# Don't bother adding a truncated block smaller than this
+MIN_BLOCK_TOKENS = 40
+
+HEADER_RE = re.compile(r"\A(?:(?:Section|Subsection): [^\n]*\n)+\n?")
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text on BPE tokenizers
+    return (len(text) + 3) // 4
+
+
+def strip_header(text: str) -> str:
+    return HEADER_RE.sub("", text, count=1)
+
+
+def remove_overlap(previous: str, text: str, max_chars: int = OVERLAP_SEARCH_CHARS) -> str:
+    """Drop the start of `text` that repeats the end of `previous`."""
+    tail = previous[-max_chars:]
+    for start in range(len(tail) - MIN_OVERLAP_CHARS + 1):
+        if text.startswith(tail[start:]):
+            return text[len(tail) - start:]
+    return text
+
+
+def _score(match: Dict[str, Any]) -> Optional[float]:
+    # "score" is not used: after fusion it is an RRF value (~0.016), not a similarity
+    score = match.get("rerank_score")
+    return match.get("dense_score") if score is None else score
+
+
+def select_matches(
+    matches: List[Dict[str, Any]],
+    min_score: float = CONTEXT_MIN_SCORE,
+    score_gap: float = CONTEXT_SCORE_GAP,
+    max_chunks: int = CONTEXT_MAX_CHUNKS,
+) -> List[Dict[str, Any]]:
+    """Score threshold plus adaptive k over matches ordered best first."""
+    # Lexical fast-path matches carry no dense score and are kept
+    relevant = [
+        m for m in matches
+        if m.get("dense_score") is None or m["dense_score"] >= min_score
+    ]
+    if not relevant:
+        # Nothing clears the threshold: the best guess beats an empty context
+        relevant = matches[:1]
+    if not relevant:
+        return []
+
+    best = _score(relevant[0])
+    if best is None:
+        # Unreranked lexical matches: no score to measure a gap on
+        return relevant[:max_chunks]
+    # Like the threshold above, matches without a score are kept
+    return [m for m in relevant if _score(m) is None or _score(m) >= best - score_gap][:max_chunks]
+
+
+def _group_key(match: Dict[str, Any]) -> Tuple:
+    metadata = match.get("metadata") or {}
+    if "section" in metadata or "subsection" in metadata or "page" in metadata:
+        return (match.get("namespace"), metadata.get("source"), metadata.get("section"), metadata.get("subsection"))
+    # Tickets and other standalone records are never merged
+    return (match.get("namespace"), match.get("id"))
+
+
+def _heading(metadata: Dict[str, Any], pages: List[int]) -> str:
+    parts = [p for p in (metadata.get("section"), metadata.get("subsection")) if p]
+    if pages:
+        first, last = min(pages), max(pages)
+        parts.append(f"p. {first}" if first == last else f"pp. {first}-{last}")
+    return f"[{' / '.join(parts)}]\n" if parts else ""
+
+
+def merge_chunks(matches: List[Dict[str, Any]]) -> List[str]:
+    """One text block per section, in order of each section's best match."""
+    groups: Dict[Tuple, List[Dict[str, Any]]] = {}
+    for match in matches:
+        groups.setdefault(_group_key(match), []).append(match)
+
+    blocks = []
+    for group in groups.values():
+        # Page order inside a section so overlaps line up
+        group = sorted(group, key=lambda m: m["metadata"].get("page", 0))
+        merged = ""
+        for match in group:
+            text = strip_header(match["metadata"].get("text", "")).strip()
+            text = remove_overlap(merged, text) if merged else text
+            if text and text not in merged:
+                merged = f"{merged}\n{text}" if merged else text
+
+        pages = [m["metadata"]["page"] for m in group if "page" in m["metadata"]]
+        blocks.append(_heading(group[0]["metadata"], pages) + merged)
+    return blocks
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    cut = text[:max_tokens * 4]
+    # End on a sentence or line boundary when there is one
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    return cut[:boundary + 1] if boundary > len(cut) // 2 else cut
+
+
+def build_context(
+    matches: List[Dict[str, Any]],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    **select_kwargs,
+) -> Tuple[str, Dict[str, Optional[int]]]:
+    """Prompt context for ranked matches, plus stats on what was kept."""
+    selected = select_matches(matches, **select_kwargs)
+    blocks = merge_chunks(selected)
+
+    kept, used = [], 0
+    for block in blocks:
+        tokens = estimate_tokens(block)
+        if used + tokens > token_budget:
+            remaining = token_budget - used
+            if remaining >= MIN_BLOCK_TOKENS:
+                block = _truncate(block, remaining)
+                kept.append(block)
+                used += estimate_tokens(block)
+            break
+        kept.append(block)
+        used += tokens
+
+    raw = sum(estimate_tokens(m["metadata"].get("text", "")) for m in matches)
+    stats = {"matches": len(matches), "selected": len(selected), "blocks": len(kept), "tokens": used, "raw_tokens": raw}
+    return "\n\n".join(kept), stats
@@ -2,15 +2,15 @@ from langchain_core.documents import Document
 from typing import List
 import json
 from typing import List, Dict, Any, Optional
-from langchain_huggingface import HuggingFaceEmbeddings
-import numpy as np
-from pinecone import Pinecone
-import os
+from embeddingModel import embed_texts, load_embeddings, parity_error, EMBEDDING_MODEL_ID, DEFAULT_BATCH_SIZE, DEFAULT_WORKERS
+from ingestPipeline import ingest_documents, Manifest
+from vectorStore import open_index
+from ciRouter import build_centroids
+from lexicalIndex import TICKET_FIELDS
 
 from dotenv import load_dotenv
 load_dotenv()
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 
 def serialize_record(record: Dict[str, Any]) -> str:
     """
@@ -48,8 +48,21 @@ def to_documents_per_object(records: List[Dict[str, Any]], *, source: str = "tic
     return docs
 
 
+def lexical_text(doc: Document) -> str:
+    """
+    Text indexed by BM25 for a ticket: only the symptom / root cause / fix /
+    configuration item fields, recovered from the serialized record.
+    """
+    fields = []
+    for line in doc.page_content.splitlines():
+        key, _, value = line.partition(": ")
+        if key in TICKET_FIELDS:
+            fields.append(value)
+    return "\n".join(fields)
+
+
 # Main embedding function
-def embedder(file_name):
+def embedder(file_name, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS, check_parity=False, incremental=True):
     with open(f"data/text_files/{file_name}", "r", encoding="utf-8") as f:
         records = json.load(f)
     # print(records)
@@ -70,38 +83,40 @@ def embedder(file_name):
     # print(doc)
 
     print("Sample Doc-----", docs[0])
-    # Load HuggingFace Embedding Model
-    embeddings = HuggingFaceEmbeddings(
-        model_name = "sentence-transformers/all-mpnet-base-v2",
+    if check_parity:
+        texts = [doc.page_content for doc in docs[:8]]
+        vectors = embed_texts(texts, batch_size=batch_size, workers=1)
+        print("Max diff vs embed_query-----", parity_error(texts, vectors, load_embeddings(batch_size)))
+
+    #Adding MetaData for storing in VectorDB (Pinecone); ids are content hashes
+    def make_metadata(doc):
+        return {
+            "text": doc.page_content,
+            **doc.metadata
+        }
+
+    pinecone_index = open_index()
+
+    #Embedding and upserting overlap batch by batch; unchanged tickets are skipped
+    ingest_documents(
+        docs,
+        namespace="ticket_docs",
+        index=pinecone_index,
+        source=file_name,
+        id_prefix="ticket_doc",
+        make_metadata=make_metadata,
+        lexical_text=lexical_text,
+        incremental=incremental,
+        batch_size=batch_size,
+        workers=workers
     )
 
-    #Converting the Docs into vectors
-    vectors = [
-        embeddings.embed_query(doc.page_content)
-        for doc in docs
-    ]
-    # for vector in vectors:  
-    #     print(vector)
-    print("Sample Vector-----", vectors[0])
-
-    #Adding MetaData and id for storing in VectorDB (Pinecone)
-    index = []
-    for i in range(len(vectors)):
-        index.append({
-            "id": f"ticket_doc_{i+1}",
-            "values": vectors[i],  # good practice to cast to float32 for storage
-            "metadata": {
-                "text": docs[i].page_content,
-                **docs[i].metadata
-            }
-        })
-
-    pc = Pinecone(api_key = f"{PINECONE_API_KEY}")
-    pinecone_index = pc.Index("rag")
-    pinecone_index.upsert(
-    vectors=index,
-    namespace="ticket_docs"
+    #Per configuration_item centroids used to route queries to the right tickets
+    build_centroids(
+        pinecone_index,
+        "ticket_docs",
+        Manifest("ticket_docs").all_ids(),
+        model_name=EMBEDDING_MODEL_ID
     )
-    print("Inserted Vectors into Pinecone")
 
 # embedder("IAMtickets.json")
\ No newline at end of file
@@ -1,15 +1,88 @@
 from langchain_core.documents import Document
-from typing import List, Dict, Any, Optional
-from langchain_huggingface import HuggingFaceEmbeddings
+from typing import List, Dict, Any, Optional, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import chain, islice
+from embeddingModel import embed_texts, load_embeddings, parity_error, resolve_workers, available_cores, DEFAULT_BATCH_SIZE, DEFAULT_WORKERS
 import fitz  # PyMuPDF
 from dotenv import load_dotenv
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-import numpy as np
-from pinecone import Pinecone
+from ingestPipeline import ingest_documents
+from layoutCache import LayoutCache, LAYOUT_CACHE_DIR
 import os
+import tempfile
 
 load_dotenv()
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+
+# Processes used to extract PDF pages (1 = serial, "auto" = one per core)
+PDF_WORKERS = os.getenv("PDF_WORKERS", "1")
+# Pages each extraction process must have to pay for its start-up. Measured on the
+# 111 page ECS guide: ~2.5 ms per page serially, ~65 ms to start each worker
+# (serial 0.27 s, 2 workers 0.36 s, 4 workers 0.54 s), so smaller PDFs stay serial
+PDF_POOL_PAGES_PER_WORKER = int(os.getenv("PDF_POOL_PAGES_PER_WORKER", "100"))
+
+# --------------------------------------------------
+# PAGE EXTRACTION
+# --------------------------------------------------
+def extract_page_lines(page) -> List[tuple]:
+    """
+    Raw layout of one page: (block_no, block_y, line_y, max_span_size, text)
+    for every non-empty text line, in PyMuPDF reading order.
+    """
+    lines = []
+    for block_no, block in enumerate(page.get_text("dict")["blocks"]):
+        if "lines" not in block:
+            continue
+
+        block_y = block["bbox"][1]
+        for line in block["lines"]:
+            line_text = " ".join(
+                span["text"] for span in line["spans"]
+            ).strip()
+
+            if not line_text:
+                continue
+
+            max_size = max(round(span["size"]) for span in line["spans"])
+            lines.append((block_no, block_y, line["bbox"][1], max_size, line_text))
+    return lines
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[List[tuple]]:
+    # Runs in a worker process; every worker opens its own handle on the PDF
+    doc = fitz.open(pdf_path)
+    return [extract_page_lines(doc[i]) for i in range(start, stop)]
+
+
+def iter_page_lines(pdf_path: str, workers=1) -> Iterator[List[tuple]]:
+    """
+    Yield the raw lines of every page in page order, extracted by a process pool
+    only when there are spare cores and enough pages for it to pay off
+    """
+    doc = fitz.open(pdf_path)
+    # More processes than cores only adds start-up and pickling cost
+    workers = min(resolve_workers(workers), available_cores(), len(doc) // PDF_POOL_PAGES_PER_WORKER)
+
+    if workers <= 1:
+        for page in doc:
+            yield extract_page_lines(page)
+        return
+
+    page_count = len(doc)
+    doc.close()
+    # Several ranges per worker so a slow range does not stall the rest
+    range_size = max(1, -(-page_count // (workers * 4)))
+    ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, stop in ranges:
+            pending.append(pool.submit(_extract_page_range, pdf_path, start, stop))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
 
 # --------------------------------------------------
 # PDF SECTION CHUNKER
@@ -21,11 +94,14 @@ class PDFSectionChunker:
         chunk_overlap=150,
         heading_min_size=14,
         heading_max_size=18,
+        cache_dir=LAYOUT_CACHE_DIR,
     ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.heading_min_size = heading_min_size
         self.heading_max_size = heading_max_size
+        # Parsed page layout is cached here by PDF hash (None disables the cache)
+        self.cache_dir = cache_dir
 
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
@@ -33,7 +109,7 @@ class PDFSectionChunker:
             separators=["\n\n", "\n", ". "]
         )
 
-    def _flush_buffer(self, text: str, metadata: dict, documents: List[Document]):
+    def _flush_buffer(self, text: str, metadata: dict) -> Iterator[Document]:
         """Split buffered text and attach metadata to every chunk"""
         for chunk in self.splitter.split_text(text):
             header = ""
@@ -46,102 +122,118 @@ class PDFSectionChunker:
             if header:
                 header += "\n"
 
-            documents.append(
-                Document(
-                    page_content=header + chunk,
-                    metadata=metadata.copy()
-                )
+            yield Document(
+                page_content=header + chunk,
+                metadata=metadata.copy()
             )
 
-    def process_pdf(self, pdf_path: str) -> List[Document]:
-        doc = fitz.open(pdf_path)
-
-        pages = []
-        all_heading_sizes = set()
-
-        # --------------------------------------------------
-        # 1️⃣ Extract headings + text blocks
-        # --------------------------------------------------
-        for page_no, page in enumerate(doc, 1):
-            headings = []
-            blocks = []
-
-            for block in page.get_text("dict")["blocks"]:
-                if "lines" not in block:
-                    continue
-
-                block_text = []
-                block_y = block["bbox"][1]
-
-                for line in block["lines"]:
-                    line_text = " ".join(
-                        span["text"] for span in line["spans"]
-                    ).strip()
-
-                    if not line_text:
-                        continue
-
-                    sizes = [round(span["size"]) for span in line["spans"]]
-                    max_size = max(sizes)
-
-                    if self.heading_min_size <= max_size <= self.heading_max_size:
-                        headings.append({
-                            "text": line_text,
-                            "size": max_size,
-                            "y": line["bbox"][1]
-                        })
-                        all_heading_sizes.add(max_size)
-                    else:
-                        block_text.append(line_text)
+    def _build_page(self, page_no: int, lines: List[tuple]) -> dict:
+        """Split a page's raw lines into headings and text blocks"""
+        headings = []
+        blocks = []
+        block_text = []
+        current_block, block_y = None, None
 
+        for block_no, line_block_y, line_y, max_size, line_text in lines:
+            if block_no != current_block:
                 if block_text:
                     blocks.append({
                         "text": " ".join(block_text),
                         "y": block_y
                     })
-
-            pages.append({
-                "page": page_no,
-                "headings": sorted(headings, key=lambda x: x["y"]),
-                "blocks": sorted(blocks, key=lambda x: x["y"])
+                block_text = []
+                current_block, block_y = block_no, line_block_y
+
+            if self.heading_min_size <= max_size <= self.heading_max_size:
+                headings.append({
+                    "text": line_text,
+                    "size": max_size,
+                    "y": line_y
+                })
+            else:
+                block_text.append(line_text)
+
+        if block_text:
+            blocks.append({
+                "text": " ".join(block_text),
+                "y": block_y
             })
 
-        # --------------------------------------------------
-        # 2️⃣ Detect heading hierarchy
-        # --------------------------------------------------
-        sizes = sorted(all_heading_sizes, reverse=True)
+        return {
+            "page": page_no,
+            "headings": sorted(headings, key=lambda x: x["y"]),
+            "blocks": sorted(blocks, key=lambda x: x["y"])
+        }
+
+    @staticmethod
+    def _heading_levels(heading_sizes) -> tuple:
+        sizes = sorted({int(size) for size in heading_sizes}, reverse=True)
         h1_size = sizes[0] if len(sizes) > 0 else None
         h2_size = sizes[1] if len(sizes) > 1 else None
+        return h1_size, h2_size
+
+    def iter_documents(self, pdf_path: str, workers=1) -> Iterator[Document]:
+        """
+        Yield chunk Documents as sections close. Only the current page and
+        the open section are held in memory, whatever the size of the PDF.
+        """
+        if self.cache_dir:
+            yield from self._iter_sections(pdf_path, self.cache_dir, workers)
+            return
+
+        # Heading sizes must be known before the first page is chunked, so even
+        # without a cache the one parallel parse is spooled to a scratch layout
+        scratch = tempfile.TemporaryDirectory(prefix="pdf-layout-")
+        try:
+            yield from self._iter_sections(pdf_path, scratch.name, workers)
+        finally:
+            scratch.cleanup()
+
+    def _iter_sections(self, pdf_path: str, cache_dir: str, workers) -> Iterator[Document]:
+        # --------------------------------------------------
+        # 1️⃣ Detect heading hierarchy from the cached line sizes
+        # --------------------------------------------------
+        # Parse once into the cache (line sizes come from the extraction workers),
+        # then both passes read the cached columns
+        cache = LayoutCache(pdf_path, cache_dir)
+        if not cache.exists():
+            cache.write(iter_page_lines(pdf_path, workers))
+        sizes = cache.sizes()
+        h1_size, h2_size = self._heading_levels(
+            sizes[(sizes >= self.heading_min_size) & (sizes <= self.heading_max_size)]
+        )
+        pages = cache.iter_pages()
 
         # print("Detected heading sizes:", {"H1": h1_size, "H2": h2_size})
 
         # --------------------------------------------------
-        # 3️⃣ Section-aware chunking
+        # 2️⃣ Section-aware chunking over streamed pages
         # --------------------------------------------------
-        documents = []
         current_h1, current_h2 = None, None
-        section_buffer = ""
+        page_no = None
+        # Buffered block texts + running length instead of repeated string +=
+        section_parts = []
+        section_len = 0
 
-        for page in pages:
+        for page_no, lines in enumerate(pages, 1):
+            page = self._build_page(page_no, lines)
             heads = page["headings"]
-            blocks = page["blocks"]
             head_idx = 0
 
-            for block in blocks:
+            for block in page["blocks"]:
                 # Update section on heading transition
                 while head_idx < len(heads) and heads[head_idx]["y"] < block["y"]:
-                    if section_buffer.strip():
-                        self._flush_buffer(
-                            section_buffer,
+                    if section_parts:
+                        yield from self._flush_buffer(
+                            "".join(section_parts),
                             {
-                                "page": page["page"],
+                                "page": page_no,
                                 "section": current_h1,
                                 "subsection": current_h2,
                                 "source": pdf_path
-                            },
-                            documents
+                            }
                         )
-                        section_buffer = ""
+                        section_parts, section_len = [], 0
 
                     h = heads[head_idx]
                     if h["size"] == h1_size:
@@ -154,92 +246,82 @@ class PDFSectionChunker:
 
                 # Always keep metadata updated
                 section_meta = {
-                    "page": page["page"],
+                    "page": page_no,
                     "section": current_h1,
                     "subsection": current_h2,
                     "source": pdf_path
                 }
 
-                section_buffer += block["text"] + "\n\n"
+                text = block["text"] + "\n\n"
+                section_parts.append(text)
+                section_len += len(text)
 
-                if len(section_buffer) >= self.chunk_size:
-                    self._flush_buffer(section_buffer, section_meta, documents)
-                    section_buffer = ""
+                if section_len >= self.chunk_size:
+                    yield from self._flush_buffer("".join(section_parts), section_meta)
+                    section_parts, section_len = [], 0
 
         # Flush remaining text
-        if section_buffer.strip():
-            self._flush_buffer(
-                section_buffer,
+        if section_parts:
+            yield from self._flush_buffer(
+                "".join(section_parts),
                 {
-                    "page": page["page"],
+                    "page": page_no,
                     "section": current_h1,
                     "subsection": current_h2,
                     "source": pdf_path
-                },
-                documents
+                }
             )
 
-        return documents
-    
+    def process_pdf(self, pdf_path: str, workers=1) -> List[Document]:
+        return list(self.iter_documents(pdf_path, workers))
+
 def clean_metadata(metadata: dict) -> dict:
     return {k: v for k, v in metadata.items() if v is not None}
 
 
 # MAIN Embedding Function
 # --------------------------------------------------
-def embedder(file_path):
+def embedder(file_path, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS, check_parity=False, incremental=True, pdf_workers=PDF_WORKERS):
 
     chunker = PDFSectionChunker(
         chunk_size=1000,
         chunk_overlap=150
     )
 
-    docs = chunker.process_pdf(f"data\pdf\{file_path}")
-
-    print("Total chunks:", len(docs))
-    # print("Sample document:\n", docs[0])
-    # print("Sample metadata:\n", docs[0].metadata)
-
-    # EMBEDDINGS
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-mpnet-base-v2"
-    )
-
-    vectors = [
-        embeddings.embed_query(doc.page_content)
-        for doc in docs
-    ]
-    # for vector in vectors:  
-    #     print(vector)
-    # print("Sample Vector-----", vectors[0])
+    # Chunks are generated lazily and flow straight into embedding + upsert
+    docs = chunker.iter_documents(f"data\pdf\{file_path}", workers=pdf_workers)
 
-    # # --------------------------------------------------
-    # # PINECONE-READY VECTORS
-    # # --------------------------------------------------
+    if check_parity:
+        head = list(islice(docs, 8))
+        texts = [doc.page_content for doc in head]
+        vectors = embed_texts(texts, batch_size=batch_size, workers=1)
+        print("Max diff vs embed_query:", parity_error(texts, vectors, load_embeddings(batch_size)))
+        docs = chain(head, docs)
 
-    index = []
-    for i, doc in enumerate(docs):
+    # --------------------------------------------------
+    # EMBED + UPSERT (streamed in batches)
+    # --------------------------------------------------
+    def make_metadata(doc):
         metadata = {
             "text": doc.page_content,
             **doc.metadata
         }
         # remove None values
-        metadata = clean_metadata(metadata)
-
-        index.append({
-            "id": f"user_guide_doc_{i+1}",
-            "values": vectors[i],  # must be List[float], NOT string
-            "metadata": metadata
-        })
-
-    # print("Sample records:\n", index[0:3])
-
-    pc = Pinecone(api_key = f"{PINECONE_API_KEY}")
-    pinecone_index = pc.Index("rag")
-    pinecone_index.upsert(
-    vectors=index,
-    namespace="user_guide_docs"
+        return clean_metadata(metadata)
+
+    # ids are content hashes, so only new or edited chunks get re-embedded
+    ingest_documents(
+        docs,
+        namespace="user_guide_docs",
+        source=file_path,
+        id_prefix="user_guide_doc",
+        make_metadata=make_metadata,
+        lexical_text=lambda doc: doc.page_content,
+        incremental=incremental,
+        batch_size=batch_size,
+        workers=workers
     )
-    print("Inserted Vectors into Pinecone")
 
-embedder("AWSiamUserGuide_modified.pdf")
\ No newline at end of file
+# Guarded so process-pool workers can import this module without re-running ingestion
+if __name__ == "__main__":
+    embedder("AWSiamUserGuide_modified.pdf")
\ No newline at end of file
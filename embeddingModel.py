@@ -0,0 +1,152 @@
+from typing import Iterable, Iterator, List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import os
+import time
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+# "torch" = sentence-transformers, "onnx" = exported int8 model on onnxruntime (onnxEmbeddings.py),
+# which only loads once its parity report has been recorded
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Vectors from the two backends differ slightly, so cached query vectors are keyed per backend
+EMBEDDING_MODEL_ID = EMBEDDING_MODEL_NAME if EMBEDDING_BACKEND == "torch" else f"{EMBEDDING_MODEL_NAME}#{EMBEDDING_BACKEND}"
+
+# Texts per sentence-transformers encode() call
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# 1 = embed in-process, N = process pool of N workers, "auto" = one per core
+DEFAULT_WORKERS = os.getenv("EMBED_WORKERS", "1")
+
+
+def load_embeddings(batch_size: int = DEFAULT_BATCH_SIZE, backend: str = EMBEDDING_BACKEND, threads: int = 0):
+    """Embedding model with embed_query / embed_documents; threads=0 keeps the backend default."""
+    if backend == "onnx":
+        from onnxEmbeddings import ONNX_THREADS, OnnxEmbeddings
+        return OnnxEmbeddings(EMBEDDING_MODEL_NAME, threads=threads or ONNX_THREADS, batch_size=batch_size)
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r} (expected 'torch' or 'onnx')")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        encode_kwargs={"batch_size": batch_size},
+    )
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resolve_workers(workers) -> int:
+    if workers == "auto":
+        return available_cores()
+    return max(1, int(workers))
+
+
+# --------------------------------------------------
+# PROCESS POOL WORKERS
+# --------------------------------------------------
+_worker_embeddings = None
+
+
+def _init_worker(batch_size: int, threads: int):
+    global _worker_embeddings
+    # Split the cores between workers instead of every worker grabbing all of them
+    if EMBEDDING_BACKEND == "torch":
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    _worker_embeddings = load_embeddings(batch_size, threads=threads)
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+
+# --------------------------------------------------
+# BATCHED EMBEDDING
+# --------------------------------------------------
+def embed_batches(
+    batches: Iterable[List[str]],
+    embeddings=None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers=DEFAULT_WORKERS,
+) -> Iterator[List[List[float]]]:
+    """
+    Embed each batch of texts through the sentence-transformers encode() path
+    and yield its vectors in input order. With workers > 1 the batches run on a
+    process pool, with at most two batches per worker in flight so a lazy
+    input is never read far ahead of the consumer.
+    """
+    start = time.perf_counter()
+    total = 0
+    workers = resolve_workers(workers)
+
+    if workers > 1:
+        if EMBEDDING_BACKEND == "onnx":
+            # Export once here; concurrent first exports from the workers would race on the model dir
+            from onnxEmbeddings import prepare_model
+            prepare_model(EMBEDDING_MODEL_NAME)
+        threads = max(1, available_cores() // workers)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(batch_size, threads),
+        ) as pool:
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.submit(_embed_batch, batch))
+                if len(pending) >= workers * 2:
+                    vectors = pending.popleft().result()
+                    total += len(vectors)
+                    yield vectors
+            while pending:
+                vectors = pending.popleft().result()
+                total += len(vectors)
+                yield vectors
+    else:
+        embeddings = embeddings or load_embeddings(batch_size)
+        for batch in batches:
+            vectors = embeddings.embed_documents(batch)
+            total += len(vectors)
+            yield vectors
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed > 0 else float("inf")
+    print(f"Embedded {total} chunks in {elapsed:.2f}s ({rate:.1f} chunks/sec, workers={workers}, batch_size={batch_size})")
+
+
+def embed_texts(
+    texts: List[str],
+    embeddings=None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers=DEFAULT_WORKERS,
+) -> List[List[float]]:
+    """Embed a list of texts in batches; output order matches `texts`."""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    workers = min(resolve_workers(workers), max(1, len(batches)))
+    return [
+        v
+        for vectors in embed_batches(batches, embeddings, batch_size, workers)
+        for v in vectors
+    ]
+
+
+def parity_error(texts: List[str], vectors: List[List[float]], embeddings=None, sample: int = 8) -> float:
+    """
+    Max absolute difference between batched vectors and the per-document
+    embed_query() path on a sample of texts (padding noise is ~1e-6).
+    """
+    embeddings = embeddings or load_embeddings()
+    step = max(1, len(texts) // sample)
+    worst = 0.0
+    for i in range(0, len(texts), step):
+        expected = np.asarray(embeddings.embed_query(texts[i]), dtype=np.float32)
+        actual = np.asarray(vectors[i], dtype=np.float32)
+        worst = max(worst, float(np.max(np.abs(expected - actual))))
+    return worst
@@ -0,0 +1,286 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from langchain_core.documents import Document
+from embeddingModel import embed_batches, DEFAULT_BATCH_SIZE, DEFAULT_WORKERS
+from vectorStore import open_index
+from lexicalIndex import BM25Index
+from chunkStore import open_store, CHUNK_STORE
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Vectors per upsert request (Pinecone recommends ~100 per call / 2MB)
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "4"))
+# Upsert batches allowed in flight before the producer blocks
+UPSERT_MAX_PENDING = int(os.getenv("UPSERT_MAX_PENDING", "8"))
+UPSERT_RETRIES = int(os.getenv("UPSERT_RETRIES", "3"))
+
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --------------------------------------------------
+# STREAMING UPSERT
+# --------------------------------------------------
+class BatchUpserter:
+    """
+    Sends records to the index in fixed-size batches over a bounded thread
+    pool. add() blocks once `max_pending` batches are in flight, which is
+    the backpressure that keeps producer memory flat.
+    """
+
+    def __init__(
+        self,
+        index,
+        namespace: str,
+        batch_size: int = UPSERT_BATCH_SIZE,
+        max_workers: int = UPSERT_WORKERS,
+        max_pending: int = UPSERT_MAX_PENDING,
+        retries: int = UPSERT_RETRIES,
+        backoff: float = 1.0,
+    ):
+        self.index = index
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._buffer: List[Dict[str, Any]] = []
+        self._futures = deque()
+        self.upserted = 0
+        self.failed_batches = 0
+
+    def _send(self, records: List[Dict[str, Any]]) -> int:
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    self.index.upsert(vectors=records, namespace=self.namespace)
+                    return len(records)
+                except Exception as e:
+                    if attempt == self.retries:
+                        raise
+                    wait = self.backoff * (2 ** attempt)
+                    print(f"Upsert of {len(records)} vectors failed ({e}), retrying in {wait:.1f}s")
+                    time.sleep(wait)
+        finally:
+            self._slots.release()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        self._slots.acquire()
+        self._futures.append(self._pool.submit(self._send, self._buffer))
+        self._buffer = []
+        # Drop finished futures so the list does not grow with the corpus
+        while self._futures and self._futures[0].done():
+            self._collect(self._futures.popleft())
+
+    def _collect(self, future):
+        try:
+            self.upserted += future.result()
+        except Exception as e:
+            self.failed_batches += 1
+            print(f"❌ Upsert batch failed after {self.retries} retries: {e}")
+
+    def add(self, record: Dict[str, Any]):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+
+    def close(self) -> int:
+        self._flush()
+        while self._futures:
+            self._collect(self._futures.popleft())
+        self._pool.shutdown(wait=True)
+        if self.failed_batches:
+            raise RuntimeError(
+                f"{self.failed_batches} upsert batches to '{self.namespace}' failed; "
+                f"{self.upserted} vectors were written"
+            )
+        return self.upserted
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(wait=True)
+
+
+# --------------------------------------------------
+# CONTENT-HASH IDS + MANIFEST
+# --------------------------------------------------
+MANIFEST_DIR = os.getenv("INGEST_MANIFEST_DIR", "data/manifests")
+# Max ids per delete request
+DELETE_BATCH_SIZE = 1000
+
+
+def content_id(prefix: str, doc: Document) -> str:
+    """Stable vector id derived from the chunk text and its metadata."""
+    payload = json.dumps(
+        {"text": doc.page_content, "metadata": doc.metadata},
+        sort_keys=True,
+        default=str,
+    )
+    return f"{prefix}_{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]}"
+
+
+class Manifest:
+    """
+    Local record of which vector ids each source file currently has in a
+    namespace, so a re-run only embeds new chunks and deletes stale ones.
+    """
+
+    def __init__(self, namespace: str, directory: str = MANIFEST_DIR):
+        self.path = os.path.join(directory, f"{namespace}.json")
+        self.sources: Dict[str, List[str]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.sources = json.load(f)["sources"]
+
+    def ids(self, source: str) -> Set[str]:
+        return set(self.sources.get(source, []))
+
+    def all_ids(self) -> Set[str]:
+        return {doc_id for ids in self.sources.values() for doc_id in ids}
+
+    def set_ids(self, source: str, ids: Iterable[str]):
+        self.sources[source] = sorted(ids)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"sources": self.sources}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+# --------------------------------------------------
+# EMBED + UPSERT PIPELINE
+# --------------------------------------------------
+def ingest_documents(
+    docs: Iterable[Document],
+    namespace: str,
+    source: str,
+    id_prefix: str,
+    make_metadata: Callable[[Document], Dict[str, Any]],
+    index=None,
+    lexical_text: Optional[Callable[[Document], str]] = None,
+    incremental: bool = True,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers=DEFAULT_WORKERS,
+    embeddings=None,
+    upsert_batch_size: int = UPSERT_BATCH_SIZE,
+    upsert_workers: int = UPSERT_WORKERS,
+    max_pending: int = UPSERT_MAX_PENDING,
+    chunk_store: bool = CHUNK_STORE,
+) -> Dict[str, int]:
+    """
+    Stream documents through embedding and upsert. Embedding of the next
+    batch overlaps with in-flight upserts, and only a bounded number of
+    batches is alive at any time, whatever the size of `docs`.
+
+    Ids are content hashes. With `incremental`, chunks already recorded in
+    the manifest for `source` are skipped, and ids that disappeared from
+    `source` are deleted from the index.
+
+    `embeddings` replaces the default model on the single-process path.
+
+    With `lexical_text`, the BM25 index of the namespace is kept in step:
+    lexical_text(doc) is indexed for every chunk it does not hold yet.
+
+    With `chunk_store`, chunk text is appended to the namespace's chunk
+    store (chunkStore.py) and "text" is dropped from make_metadata(doc) for
+    the vector and BM25 metadata; without it the text stays in both.
+    """
+    index = index or open_index()
+    manifest = Manifest(namespace)
+    previous_ids = manifest.ids(source) if incremental else set()
+    current_ids: Set[str] = set()
+    in_flight = deque()
+    lexical = BM25Index(namespace) if lexical_text else None
+    store = open_store(namespace) if chunk_store else None
+
+    def metadata_for(doc):
+        metadata = make_metadata(doc)
+        if store is not None:
+            metadata.pop("text", None)
+        return metadata
+
+    def changed_docs():
+        for doc in docs:
+            doc_id = content_id(id_prefix, doc)
+            if doc_id in current_ids:
+                continue
+            current_ids.add(doc_id)
+            # Tokenising is cheap, so chunks missing from the BM25 index are added even when unchanged
+            if lexical is not None and doc_id not in lexical:
+                lexical.add(doc_id, lexical_text(doc), metadata_for(doc))
+            if store is not None and doc_id not in store:
+                store.add(doc_id, doc.page_content)
+            if doc_id not in previous_ids:
+                yield doc_id, doc
+
+    def texts():
+        for batch in iter_batches(changed_docs(), batch_size):
+            in_flight.append(batch)
+            yield [doc.page_content for _, doc in batch]
+
+    with BatchUpserter(
+        index,
+        namespace,
+        batch_size=upsert_batch_size,
+        max_workers=upsert_workers,
+        max_pending=max_pending,
+    ) as upserter:
+        for vectors in embed_batches(texts(), embeddings=embeddings, batch_size=batch_size, workers=workers):
+            for (doc_id, doc), vector in zip(in_flight.popleft(), vectors):
+                upserter.add({
+                    "id": doc_id,
+                    "values": vector,
+                    "metadata": metadata_for(doc),
+                })
+
+    stale_ids = sorted(manifest.ids(source) - current_ids)
+    for batch in iter_batches(stale_ids, DELETE_BATCH_SIZE):
+        index.delete(ids=batch, namespace=namespace)
+
+    if lexical is not None:
+        for doc_id in stale_ids:
+            lexical.remove(doc_id)
+        lexical.save()
+
+    if store is not None:
+        for doc_id in stale_ids:
+            store.remove(doc_id)
+        store.save()
+
+    manifest.set_ids(source, current_ids)
+    manifest.save()
+
+    # Quantized codes are trained / refreshed here, never by the first query
+    if hasattr(index, "update_quantizer"):
+        index.update_quantizer(namespace)
+
+    stats = {
+        "upserted": upserter.upserted,
+        "unchanged": len(current_ids) - upserter.upserted,
+        "deleted": len(stale_ids),
+    }
+    print(f"'{namespace}' <- {source}: {stats['upserted']} new/changed, {stats['unchanged']} unchanged, {stats['deleted']} stale deleted")
+    return stats
@@ -0,0 +1,245 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+
+# --------------------------------------------------
+# AGENT INSTRUMENTATION
+# Per node and per thread wall time, prompt / completion tokens, retrieved
+# chunk counts and query cache hits for the agent graph and the RAG path.
+# Exposed as Prometheus text (GET /metrics), a per-thread JSON summary
+# (GET /threads) and optionally as JSON lines. Disabled by default, and
+# when disabled the graph nodes are not even wrapped.
+# --------------------------------------------------
+
+AGENT_METRICS = os.getenv("AGENT_METRICS", "0") == "1"
+# Append one JSON line per node call / retrieval here (empty: no file)
+METRICS_JSONL_PATH = os.getenv("METRICS_JSONL_PATH", "")
+# Serve /metrics and /threads on this port (0: no endpoint)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Loopback only; /threads exposes thread ids, so binding wider (e.g. 0.0.0.0) is opt-in
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Threads kept in the per-thread summary
+METRICS_MAX_THREADS = int(os.getenv("METRICS_MAX_THREADS", "1000"))
+
+METRICS = {
+    "agent_node_seconds": ("summary", "Wall time of agent graph nodes"),
+    "agent_node_tokens_total": ("counter", "LLM tokens used by agent graph nodes"),
+    "rag_stage_seconds": ("summary", "Wall time of retrieval stages"),
+    "rag_retrieved_chunks_total": ("counter", "Chunks returned by retrieval"),
+    "rag_query_cache_lookups_total": ("counter", "Query embedding cache lookups by result"),
+}
+
+# Thread id of the graph run being executed; tool pools copy it along with the context
+current_thread_id: ContextVar[Optional[str]] = ContextVar("current_thread_id", default=None)
+current_node: ContextVar[str] = ContextVar("current_node", default="none")
+
+_NULL_STAGE = nullcontext()
+
+
+def _labels(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _usage(message) -> Tuple[int, int]:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+
+class Metrics:
+    def __init__(self, enabled: bool = AGENT_METRICS, jsonl_path: str = METRICS_JSONL_PATH, max_threads: int = METRICS_MAX_THREADS):
+        self.enabled = enabled
+        self.max_threads = max_threads
+        self._values: Dict[Tuple[str, Tuple], float] = defaultdict(float)
+        self._threads: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._jsonl = open(jsonl_path, "a", encoding="utf-8") if enabled and jsonl_path else None
+        self._server = None
+
+    # ---------- recording ----------
+
+    def _add(self, name: str, value: float, labels: Dict[str, str]):
+        self._values[(name, _labels(labels))] += value
+
+    def _add_thread(self, thread_id: Optional[str], **values: float):
+        if thread_id is None:
+            return
+        totals = self._threads.get(thread_id)
+        if totals is None:
+            totals = self._threads[thread_id] = defaultdict(float)
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+        self._threads.move_to_end(thread_id)
+        for key, value in values.items():
+            totals[key] += value
+
+    def _event(self, record: Dict[str, Any]):
+        if self._jsonl is None:
+            return
+        line = json.dumps({"ts": round(time.time(), 6), "thread_id": current_thread_id.get(), **record})
+        with self._lock:
+            self._jsonl.write(line + "\n")
+            self._jsonl.flush()
+
+    def observe(self, name: str, secs: float, **labels: str):
+        with self._lock:
+            self._add(f"{name}_sum", secs, labels)
+            self._add(f"{name}_count", 1, labels)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        with self._lock:
+            self._add(name, value, labels)
+
+    @contextmanager
+    def _stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            secs = time.perf_counter() - start
+            self.observe("rag_stage_seconds", secs, stage=stage)
+            with self._lock:
+                self._add_thread(current_thread_id.get(), **{f"{stage}_seconds": secs})
+
+    def stage(self, stage: str):
+        """Context manager timing one retrieval stage (a shared no-op when disabled)."""
+        return self._stage(stage) if self.enabled else _NULL_STAGE
+
+    def record_retrieval(self, secs: float, chunks: int):
+        if not self.enabled:
+            return
+        self.observe("rag_stage_seconds", secs, stage="retrieval")
+        self.inc("rag_retrieved_chunks_total", chunks)
+        with self._lock:
+            self._add_thread(current_thread_id.get(), retrievals=1, retrieved_chunks=chunks)
+        self._event({"event": "retrieval", "secs": round(secs, 6), "chunks": chunks})
+
+    def record_cache_lookup(self, hit: bool):
+        if not self.enabled:
+            return
+        result = "hit" if hit else "miss"
+        self.inc("rag_query_cache_lookups_total", node=current_node.get(), result=result)
+        with self._lock:
+            self._add_thread(current_thread_id.get(), **{"cache_hits" if hit else "cache_misses": 1})
+
+    # ---------- graph hook ----------
+
+    def node(self, name: str, fn: Callable) -> Callable:
+        """Wrap a graph node; returns `fn` untouched when metrics are disabled."""
+        if not self.enabled:
+            return fn
+
+        def instrumented(state, config):
+            thread_id = (config.get("configurable") or {}).get("thread_id")
+            token = current_thread_id.set(thread_id)
+            node_token = current_node.set(name)
+            start = time.perf_counter()
+            result = None
+            try:
+                result = fn(state)
+                return result
+            finally:
+                secs = time.perf_counter() - start
+                messages = (result or {}).get("messages", []) if isinstance(result, dict) else []
+                prompt_tokens = completion_tokens = 0
+                for message in messages:
+                    prompt, completion = _usage(message)
+                    prompt_tokens += prompt
+                    completion_tokens += completion
+
+                self.observe("agent_node_seconds", secs, node=name)
+                with self._lock:
+                    if prompt_tokens or completion_tokens:
+                        self._add("agent_node_tokens_total", prompt_tokens, {"node": name, "kind": "prompt"})
+                        self._add("agent_node_tokens_total", completion_tokens, {"node": name, "kind": "completion"})
+                    self._add_thread(
+                        thread_id,
+                        **{f"{name}_seconds": secs, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens},
+                    )
+                self._event({
+                    "event": "node",
+                    "node": name,
+                    "secs": round(secs, 6),
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "completed": result is not None,
+                })
+                current_node.reset(node_token)
+                current_thread_id.reset(token)
+
+        instrumented.__name__ = getattr(fn, "__name__", name)
+        return instrumented
+
+    # ---------- exposition ----------
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            values = dict(self._values)
+
+        lines = []
+        for metric, (kind, help_text) in METRICS.items():
+            series = sorted(
+                (name, labels, value) for (name, labels), value in values.items()
+                if name == metric or name in (f"{metric}_sum", f"{metric}_count")
+            )
+            if not series:
+                continue
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, labels, value in series:
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def threads(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            threads = {thread_id: dict(totals) for thread_id, totals in self._threads.items()}
+        for totals in threads.values():
+            lookups = totals.get("cache_hits", 0) + totals.get("cache_misses", 0)
+            if lookups:
+                totals["cache_hit_rate"] = totals.get("cache_hits", 0) / lookups
+        return threads
+
+    def serve(self, port: int = METRICS_PORT, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+        """Serve GET /metrics (Prometheus text) and GET /threads (JSON) from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics"):
+                    body, content_type = metrics.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+                elif self.path.startswith("/threads"):
+                    body, content_type = json.dumps(metrics.threads()).encode("utf-8"), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics").start()
+        print(f"Serving agent metrics on http://{host}:{self._server.server_port}/metrics")
+        return self._server
+
+
+metrics = Metrics()
@@ -0,0 +1,118 @@
+from typing import Iterable, Iterator, List
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+# --------------------------------------------------
+# PDF LAYOUT CACHE
+# Per-line layout extracted by PyMuPDF, stored column by column in flat
+# binary files and keyed by the PDF content hash. Re-chunking with other
+# chunk sizes or heading bands then reads the cache instead of re-parsing.
+# --------------------------------------------------
+
+LAYOUT_CACHE_DIR = os.getenv("PDF_LAYOUT_CACHE_DIR", "data/cache/layout")
+
+# Bump when extract_page_lines changes what it records
+LAYOUT_FORMAT_VERSION = 1
+
+COLUMNS = {
+    "page_offsets": np.int64,   # first line index of every page (+ end)
+    "block": np.int32,
+    "block_y": np.float64,
+    "line_y": np.float64,
+    "size": np.int32,
+    "text_offsets": np.int64,   # byte offset of every line in text.bin (+ end)
+}
+TEXT_FILE = "text.bin"
+META_FILE = "meta.json"
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LayoutCache:
+    def __init__(self, pdf_path: str, directory: str = LAYOUT_CACHE_DIR):
+        self.key = f"{file_hash(pdf_path)}-v{LAYOUT_FORMAT_VERSION}"
+        self.path = os.path.join(directory, self.key)
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, META_FILE))
+
+    def write(self, pages: Iterable[List[tuple]]):
+        """Stream page lines to disk; the cache only appears once complete."""
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        files = {name: open(os.path.join(tmp_path, f"{name}.bin"), "wb") for name in COLUMNS}
+        text_file = open(os.path.join(tmp_path, TEXT_FILE), "wb")
+        line_count, text_bytes, page_count = 0, 0, 0
+        try:
+            np.asarray([0], dtype=np.int64).tofile(files["page_offsets"])
+            np.asarray([0], dtype=np.int64).tofile(files["text_offsets"])
+            for lines in pages:
+                encoded = [line[4].encode("utf-8") for line in lines]
+                for name, column in (("block", 0), ("block_y", 1), ("line_y", 2), ("size", 3)):
+                    np.asarray([line[column] for line in lines], dtype=COLUMNS[name]).tofile(files[name])
+                text_file.write(b"".join(encoded))
+                offsets = text_bytes + np.cumsum([len(e) for e in encoded], dtype=np.int64)
+                offsets.tofile(files["text_offsets"])
+
+                line_count += len(lines)
+                text_bytes += sum(len(e) for e in encoded)
+                page_count += 1
+                np.asarray([line_count], dtype=np.int64).tofile(files["page_offsets"])
+        except BaseException:
+            for f in files.values():
+                f.close()
+            text_file.close()
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        for f in files.values():
+            f.close()
+        text_file.close()
+        with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"pages": page_count, "lines": line_count, "version": LAYOUT_FORMAT_VERSION}, f)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+
+    def _column(self, name: str) -> np.ndarray:
+        path = os.path.join(self.path, f"{name}.bin")
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=COLUMNS.get(name, np.uint8))
+        return np.memmap(path, dtype=COLUMNS.get(name, np.uint8), mode="r")
+
+    def sizes(self) -> np.ndarray:
+        return self._column("size")
+
+    def iter_pages(self) -> Iterator[List[tuple]]:
+        """Yield the cached lines of every page in the same shape as extract_page_lines"""
+        page_offsets = self._column("page_offsets")
+        block = self._column("block")
+        block_y = self._column("block_y")
+        line_y = self._column("line_y")
+        size = self._column("size")
+        text_offsets = self._column("text_offsets")
+        text = self._column("text")
+
+        for page in range(len(page_offsets) - 1):
+            start, stop = page_offsets[page], page_offsets[page + 1]
+            yield [
+                (
+                    int(block[i]),
+                    float(block_y[i]),
+                    float(line_y[i]),
+                    int(size[i]),
+                    bytes(text[text_offsets[i]:text_offsets[i + 1]]).decode("utf-8"),
+                )
+                for i in range(start, stop)
+            ]
@@ -0,0 +1,150 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from collections import Counter, defaultdict
+import json
+import math
+import os
+import re
+from localIndex import matches_filter
+
+# --------------------------------------------------
+# LEXICAL (BM25) INDEX
+# Built next to the vector index at ingest time. Catches exact tokens such
+# as sts:AssumeRoleWithWebIdentity or AccessDenied that dense search blurs.
+# --------------------------------------------------
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "data/lexical_index")
+
+# Ticket fields that carry the searchable signal
+TICKET_FIELDS = ("symptom", "root_cause", "fix", "configuration_item")
+
+# Words that carry no retrieval signal on their own
+STOP_WORDS = frozenset("""
+a an and are as at be but by can could do does did for from has have how i if in into is it
+its me my no not of on or our please so that the their them then there these this to was
+we were what when where which while who why will with would you your
+""".split())
+
+# Identifier-like tokens, keeping joined forms such as sts:AssumeRole or Prod-App-Role
+TOKEN_RE = re.compile(r"[A-Za-z0-9_*]+(?:[:/.\-][A-Za-z0-9_*]+)*")
+SEPARATOR_RE = re.compile(r"[:/.\-]")
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def _parts(token: str) -> List[str]:
+    parts = [p for p in SEPARATOR_RE.split(token) if p]
+    pieces = parts if len(parts) > 1 else []
+    for part in parts:
+        camel = CAMEL_RE.findall(part)
+        if len(camel) > 1:
+            pieces.extend(camel)
+    return pieces
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased tokens: the full identifier plus its separator and CamelCase parts."""
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        token = match.group(0)
+        tokens.append(token.lower())
+        tokens.extend(p.lower() for p in _parts(token))
+    return tokens
+
+
+def exact_tokens(text: str) -> List[str]:
+    """Error-code / action-like tokens (sts:AssumeRole, AccessDenied) that must match verbatim."""
+    exact = []
+    for match in TOKEN_RE.finditer(text):
+        token = match.group(0)
+        if ":" in token or (len(CAMEL_RE.findall(token)) > 1 and token[0].isupper() and not token.isupper()):
+            exact.append(token.lower())
+    return exact
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> Dict[str, float]:
+    """RRF: every ranking contributes 1 / (k + rank) to the ids it contains."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return dict(scores)
+
+
+class BM25Index:
+    def __init__(self, namespace: str, directory: str = LEXICAL_INDEX_DIR, k1: float = 1.5, b: float = 0.75):
+        self.path = os.path.join(directory, f"{namespace}.json")
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.total_length = 0
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for doc_id, doc in json.load(f)["docs"].items():
+                    self._index(doc_id, doc)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.docs
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _index(self, doc_id: str, doc: Dict[str, Any]):
+        self.docs[doc_id] = doc
+        self.total_length += doc["length"]
+        for term, tf in doc["tf"].items():
+            self.postings[term][doc_id] = tf
+
+    def add(self, doc_id: str, text: str, metadata: Dict[str, Any]):
+        self.remove(doc_id)
+        tokens = tokenize(text)
+        self._index(doc_id, {"tf": dict(Counter(tokens)), "length": len(tokens), "metadata": metadata})
+
+    def remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc["length"]
+        for term in doc["tf"]:
+            self.postings[term].pop(doc_id, None)
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"docs": self.docs}, f)
+        os.replace(tmp_path, self.path)
+
+    def search(self, query: str, top_k: int = 10, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        if not self.docs:
+            return []
+        n = len(self.docs)
+        avg_length = self.total_length / n
+        scores: Dict[str, float] = defaultdict(float)
+        allowed: Dict[str, bool] = {}
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                if filter:
+                    if doc_id not in allowed:
+                        allowed[doc_id] = matches_filter(self.docs[doc_id]["metadata"], filter)
+                    if not allowed[doc_id]:
+                        continue
+                length = self.docs[doc_id]["length"]
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (
+                    tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                )
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def contains_all(self, doc_id: str, tokens: List[str]) -> bool:
+        tf = self.docs[doc_id]["tf"]
+        return all(token in tf for token in tokens)
+
+    def metadata(self, doc_id: str) -> Dict[str, Any]:
+        return self.docs[doc_id]["metadata"]
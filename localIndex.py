@@ -0,0 +1,898 @@
+from typing import List, Dict, Any, Optional, Tuple
+import json
+import os
+import threading
+import numpy as np
+
+# --------------------------------------------------
+# LOCAL VECTOR INDEX
+# Same upsert / query / delete / fetch surface as the Pinecone "rag" index,
+# backed by one memory-mapped float32 matrix per namespace. With int8 or
+# product quantization, candidates are scored on compact in-memory codes
+# and only a shortlist is re-scored against the float32 rows.
+# --------------------------------------------------
+
+DEFAULT_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "data/vector_index")
+DEFAULT_MODE = os.getenv("LOCAL_INDEX_MODE", "exact")  # exact | ivf
+DEFAULT_QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION", "none")  # none | int8 | pq
+# Recall@RECALL_K the quantized search may lose against the exact one
+RECALL_TOLERANCE = float(os.getenv("LOCAL_INDEX_RECALL_TOLERANCE", "0.02"))
+# 768 dims / 96 sub-vectors = one byte per 8 dims (32x smaller than float32)
+PQ_SUBVECTORS = int(os.getenv("LOCAL_INDEX_PQ_SUBVECTORS", "96"))
+
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.json"
+# Upserts / deletes are appended here; meta.json is only a periodic snapshot
+META_LOG_FILE = "meta.log"
+IVF_FILE = "ivf.npz"
+QUANT_FILE = "quant_{}.npz"
+
+# Below this many rows an exact scan is already cheaper than probing IVF lists
+IVF_MIN_ROWS = 4096
+# Below this many rows the float32 matrix is small enough to scan as is
+QUANT_MIN_ROWS = 1024
+# top_k of the RAG tool, which the shortlist is calibrated for
+RECALL_K = 6
+# Shortlist sizes tried during calibration, as multiples of top_k
+SHORTLIST_FACTORS = (2, 4, 8, 16, 32)
+QUANT_BLOCK_ROWS = 16384
+# Snapshot meta.json once the log outgrows it (and this floor), so writes stay linear in the corpus
+META_LOG_MIN_BYTES = 1 << 20
+# Small enough for the float32 copy of an int8 block to stay in cache
+SCORE_BLOCK_ROWS = 512
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _record_parts(record):
+    """Accept Pinecone-style dict records or (id, values[, metadata]) tuples."""
+    if isinstance(record, dict):
+        return record["id"], record["values"], record.get("metadata") or {}
+    if len(record) == 2:
+        return record[0], record[1], {}
+    return record[0], record[1], record[2] or {}
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+# --------------------------------------------------
+# METADATA FILTERS (Pinecone filter syntax subset)
+# --------------------------------------------------
+_COMPARATORS = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+}
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate {"field": value | {"$op": arg}, "$and": [...], "$or": [...]} against metadata."""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, f) for f in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, f) for f in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, arg in condition.items():
+                if op not in _COMPARATORS:
+                    raise ValueError(f"Unsupported filter operator: {op}")
+                if not _COMPARATORS[op](value, arg):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _equality_terms(filter: Dict[str, Any]):
+    """(field, allowed values) pairs that can be answered from the value index."""
+    terms = []
+    for key, condition in filter.items():
+        if key.startswith("$"):
+            continue
+        if not isinstance(condition, dict):
+            terms.append((key, [condition]))
+        elif "$eq" in condition:
+            terms.append((key, [condition["$eq"]]))
+        elif "$in" in condition:
+            terms.append((key, list(condition["$in"])))
+    return terms
+
+
+class _IVF:
+    """Inverted-file partitioning: k-means centroids plus per-centroid row lists."""
+
+    def __init__(self, centroids: np.ndarray, list_rows: np.ndarray, list_offsets: np.ndarray):
+        self.centroids = centroids
+        self.list_rows = list_rows
+        self.list_offsets = list_offsets
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> "_IVF":
+        rng = np.random.default_rng(seed)
+        n = len(matrix)
+        sample = matrix[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        # Spherical k-means on the sample
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        # Assign every row in blocks to keep the score matrix small
+        assign = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 16384):
+            block = np.asarray(matrix[start:start + 16384])
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return cls(centroids.astype(np.float32), order.astype(np.int64), offsets.astype(np.int64))
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        probe = _top_k(self.centroids @ query, min(nprobe, len(self.centroids)))
+        return np.concatenate([
+            self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe
+        ])
+
+
+def _grown(array: np.ndarray, rows: int, axis: int = 0) -> np.ndarray:
+    """`array` with room for `rows` along `axis`; capacity doubles like the vector file."""
+    capacity = array.shape[axis]
+    if rows <= capacity:
+        return array
+    shape = list(array.shape)
+    shape[axis] = max(rows, capacity * 2, 1024)
+    grown = np.empty(shape, dtype=array.dtype)
+    grown[(slice(None),) * axis + (slice(0, capacity),)] = array
+    return grown
+
+
+class _Int8:
+    """Symmetric per-row int8 codes: score ~= (codes @ query) * scale."""
+
+    kind = "int8"
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray, count: Optional[int] = None):
+        # Rows past `count` are spare capacity for upserts
+        self.codes = codes
+        self.scales = scales
+        self.count = len(codes) if count is None else count
+
+    @staticmethod
+    def encode(block: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scale = np.abs(block).max(axis=1) / 127
+        scale[scale == 0] = 1.0
+        return np.rint(block / scale[:, None]).astype(np.int8), scale.astype(np.float32)
+
+    @classmethod
+    def build(cls, matrix: np.ndarray) -> "_Int8":
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        scales = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), QUANT_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + QUANT_BLOCK_ROWS])
+            codes[start:start + len(block)], scales[start:start + len(block)] = cls.encode(block)
+        return cls(codes, scales)
+
+    def reencode(self, matrix: np.ndarray) -> "_Int8":
+        # Nothing is trained, so re-encoding is a fresh build
+        return self.build(matrix)
+
+    @classmethod
+    def load(cls, arrays) -> "_Int8":
+        return cls(arrays["codes"], arrays["scales"])
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"codes": self.codes[:self.count], "scales": self.scales[:self.count]}
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes[:self.count].nbytes + self.scales[:self.count].nbytes
+
+    def set_rows(self, rows: List[int], vectors: np.ndarray, count: int):
+        self.codes = _grown(self.codes, count)
+        self.scales = _grown(self.scales, count)
+        self.codes[rows], self.scales[rows] = self.encode(vectors)
+        self.count = count
+
+    def move(self, src: int, dst: int):
+        self.codes[dst] = self.codes[src]
+        self.scales[dst] = self.scales[src]
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        codes = self.codes[:self.count] if rows is None else self.codes[rows]
+        scales = self.scales[:self.count] if rows is None else self.scales[rows]
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + len(block)] = block @ query
+        return scores * scales
+
+
+class _PQ:
+    """Product quantization: one byte per sub-vector, scored through per-query lookup tables."""
+
+    kind = "pq"
+
+    def __init__(self, codebooks: np.ndarray, codes: np.ndarray, count: Optional[int] = None):
+        self.codebooks = codebooks  # (subvectors, centroids, sub_dim)
+        # (subvectors, capacity) uint8, so each sub-space's codes are contiguous
+        self.codes = codes
+        self.count = codes.shape[1] if count is None else count
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, subvectors: int = PQ_SUBVECTORS, iterations: int = 10, seed: int = 0) -> "_PQ":
+        n, dim = matrix.shape
+        # Largest sub-vector count <= the requested one that divides the dimension
+        subvectors = max(m for m in range(1, min(subvectors, dim) + 1) if dim % m == 0)
+        sub_dim = dim // subvectors
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(matrix[np.sort(rng.choice(n, size=min(n, 256 * 64), replace=False))])
+        k = min(256, len(sample))
+
+        # Euclidean k-means per sub-space on the sample
+        codebooks = np.empty((subvectors, k, sub_dim), dtype=np.float32)
+        for m in range(subvectors):
+            sub = sample[:, m * sub_dim:(m + 1) * sub_dim]
+            centroids = sub[rng.choice(len(sub), size=k, replace=False)].copy()
+            for _ in range(iterations):
+                assign = np.argmin((centroids ** 2).sum(axis=1) - 2 * sub @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, sub)
+                counts = np.bincount(assign, minlength=k)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            codebooks[m] = centroids
+
+        return cls(codebooks, np.empty((subvectors, 0), dtype=np.uint8)).reencode(matrix)
+
+    def reencode(self, matrix: np.ndarray) -> "_PQ":
+        """Codes for every row of `matrix` under the current codebooks (no retraining)."""
+        pq = _PQ(self.codebooks, np.empty((len(self.codebooks), len(matrix)), dtype=np.uint8))
+        for start in range(0, len(matrix), QUANT_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + QUANT_BLOCK_ROWS])
+            pq.codes[:, start:start + len(block)] = pq.encode(block).T
+        return pq
+
+    @classmethod
+    def load(cls, arrays) -> "_PQ":
+        return cls(arrays["codebooks"], arrays["codes"])
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks, "codes": self.codes[:, :self.count]}
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes[:, :self.count].nbytes + self.codebooks.nbytes
+
+    def encode(self, block: np.ndarray) -> np.ndarray:
+        subvectors, _, sub_dim = self.codebooks.shape
+        codes = np.empty((len(block), subvectors), dtype=np.uint8)
+        for m, centroids in enumerate(self.codebooks):
+            sub = block[:, m * sub_dim:(m + 1) * sub_dim]
+            codes[:, m] = np.argmin((centroids ** 2).sum(axis=1) - 2 * sub @ centroids.T, axis=1)
+        return codes
+
+    def set_rows(self, rows: List[int], vectors: np.ndarray, count: int):
+        self.codes = _grown(self.codes, count, axis=1)
+        self.codes[:, rows] = self.encode(vectors).T
+        self.count = count
+
+    def move(self, src: int, dst: int):
+        self.codes[:, dst] = self.codes[:, src]
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        subvectors, _, sub_dim = self.codebooks.shape
+        # tables[m, c] = <query sub-vector m, centroid c>
+        tables = np.einsum("mkd,md->mk", self.codebooks, query.reshape(subvectors, sub_dim))
+        codes = self.codes[:, :self.count] if rows is None else self.codes[:, rows]
+        scores = np.zeros(codes.shape[1], dtype=np.float32)
+        for table, sub_codes in zip(tables, codes):
+            scores += np.take(table, sub_codes)
+        return scores
+
+
+QUANTIZERS = {"int8": _Int8, "pq": _PQ}
+
+
+class _Namespace:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.dim = None
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.row_of: Dict[str, int] = {}
+        self.matrix = None
+        self.version = 0
+        self._snapshot_bytes = 0
+        self._log_bytes = 0
+        self._ivf = None
+        # Quantized codes follow upserts / deletes; only train_quantizer() retrains them
+        self._quantizer = None
+        self.shortlist_factor = None
+        self.calibration: Optional[Dict[str, Any]] = None
+        self._quantizer_miss = None
+        # field -> value -> rows, built lazily for equality / $in pre-filtering
+        self._value_index: Dict[str, Dict[Any, List[int]]] = {}
+        self._load()
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    # -------------------- persistence --------------------
+
+    def _load(self):
+        meta_path = os.path.join(self.path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            self.ids = meta["ids"]
+            self.metadata = meta["metadata"]
+            self.version = meta.get("version", 0)
+            self._snapshot_bytes = os.path.getsize(meta_path)
+        self.row_of = {vid: row for row, vid in enumerate(self.ids)}
+        moves = self._replay_log()
+        if self.dim is not None:
+            self._map()
+            # A crash may have stopped the last delete between its log entry and its row moves
+            self._move_rows(moves)
+            self.matrix.flush()
+
+    def _replay_log(self) -> List[Tuple[int, int]]:
+        """Fold the log into ids / metadata; returns the row moves of a trailing delete."""
+        log_path = os.path.join(self.path, META_LOG_FILE)
+        if not os.path.exists(log_path):
+            return []
+        good_bytes = 0
+        moves = []
+        with open(log_path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line of an interrupted write
+                    break
+                good_bytes += len(line)
+                # Entries already folded into the snapshot
+                if entry["version"] <= self.version:
+                    continue
+                self.dim = entry.get("dim", self.dim)
+                # Any later entry means the moves of an earlier delete reached the vectors file
+                moves = []
+                if entry["op"] == "upsert":
+                    for vid, metadata in entry["records"]:
+                        self._place(vid, metadata)
+                else:
+                    for vid in entry["ids"]:
+                        moved = self._remove(vid)
+                        if moved is not None:
+                            moves.append(moved)
+                self.version = entry["version"]
+        if good_bytes < os.path.getsize(log_path):
+            with open(log_path, "ab") as f:
+                f.truncate(good_bytes)
+        self._log_bytes = good_bytes
+        # Redoing the moves is safe whether none, some or all of them were written
+        return moves
+
+    def _map(self):
+        vectors_path = os.path.join(self.path, VECTORS_FILE)
+        capacity = os.path.getsize(vectors_path) // (4 * self.dim)
+        self.matrix = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _save(self, entry: Dict[str, Any]):
+        """Append one upsert to the log once its vectors are written."""
+        self.matrix.flush()
+        self._append_log(entry)
+        self._maybe_snapshot()
+
+    def _append_log(self, entry: Dict[str, Any], sync: bool = False):
+        line = (json.dumps({**entry, "version": self.version}) + "\n").encode("utf-8")
+        with open(os.path.join(self.path, META_LOG_FILE), "ab") as f:
+            f.write(line)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._log_bytes += len(line)
+
+    def _maybe_snapshot(self):
+        if self._log_bytes > max(self._snapshot_bytes, META_LOG_MIN_BYTES):
+            self._snapshot()
+
+    def _snapshot(self):
+        tmp_path = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self.dim,
+                "version": self.version,
+                "ids": self.ids,
+                "metadata": self.metadata,
+            }, f)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+        self._snapshot_bytes = os.path.getsize(os.path.join(self.path, META_FILE))
+        # Log entries are versioned, so a crash before this truncate only leaves entries replay skips
+        with open(os.path.join(self.path, META_LOG_FILE), "wb"):
+            pass
+        self._log_bytes = 0
+
+    def _ensure_capacity(self, rows: int):
+        capacity = 0 if self.matrix is None else self.matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, VECTORS_FILE), "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._map()
+
+    # -------------------- writes --------------------
+
+    def upsert(self, records) -> int:
+        with self.lock:
+            parts = [_record_parts(r) for r in records]
+            if not parts:
+                return 0
+            values = _normalize(np.asarray([p[1] for p in parts], dtype=np.float32))
+            if self.dim is None:
+                self.dim = values.shape[1]
+            elif values.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {values.shape[1]} does not match index dimension {self.dim}")
+
+            self._ensure_capacity(self.count + len(parts))
+            rows = []
+            for (vid, _, metadata), vector in zip(parts, values):
+                rows.append(self._place(vid, metadata))
+                self.matrix[rows[-1]] = vector
+            if self._quantizer is not None:
+                # New and changed rows are encoded with the existing model
+                self._quantizer.set_rows(rows, values, self.count)
+
+            self._invalidate()
+            self._save({"op": "upsert", "dim": self.dim, "records": [[vid, metadata] for vid, _, metadata in parts]})
+            return len(parts)
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False):
+        with self.lock:
+            if self.dim is None:
+                return
+            if delete_all:
+                ids = list(self.ids)
+            removed, moves = [], []
+            for vid in ids or []:
+                moved = self._remove(vid)
+                if moved is not None:
+                    removed.append(vid)
+                    moves.append(moved)
+            if not removed:
+                return
+            self._invalidate()
+            # Swap-remove overwrites live rows: the delete must be durable before the
+            # vectors move, so replay can redo the moves after a crash
+            self._append_log({"op": "delete", "ids": removed}, sync=True)
+            self._move_rows(moves)
+            if self._quantizer is not None:
+                self._quantizer.count = self.count
+            self.matrix.flush()
+            self._maybe_snapshot()
+
+    def _place(self, vid: str, metadata: Dict[str, Any]) -> int:
+        """Row for `vid` (appended when new), with its metadata set; the caller writes the vector."""
+        row = self.row_of.get(vid)
+        if row is None:
+            row = self.count
+            self.ids.append(vid)
+            self.metadata.append(metadata)
+            self.row_of[vid] = row
+        else:
+            self.metadata[row] = metadata
+        return row
+
+    def _remove(self, vid: str):
+        """Drop `vid` from ids / metadata; returns (row, last) for the caller to move the vector."""
+        row = self.row_of.pop(vid, None)
+        if row is None:
+            return None
+        # Swap-remove keeps the matrix dense
+        last = self.count - 1
+        if row != last:
+            self.ids[row] = self.ids[last]
+            self.metadata[row] = self.metadata[last]
+            self.row_of[self.ids[row]] = row
+        self.ids.pop()
+        self.metadata.pop()
+        return row, last
+
+    def _move_rows(self, moves: List[Tuple[int, int]]):
+        """Apply the (row, last) moves of `_remove` to the vectors, in order."""
+        for row, last in moves:
+            if row != last:
+                self.matrix[row] = self.matrix[last]
+                if self._quantizer is not None:
+                    self._quantizer.move(last, row)
+
+    def _invalidate(self):
+        self.version += 1
+        self._ivf = None
+        self._value_index = {}
+
+    # -------------------- reads --------------------
+
+    def ivf(self, nlist: Optional[int] = None) -> _IVF:
+        if self._ivf is not None:
+            return self._ivf
+        ivf_path = os.path.join(self.path, IVF_FILE)
+        if os.path.exists(ivf_path):
+            cached = np.load(ivf_path)
+            if int(cached["version"]) == self.version:
+                self._ivf = _IVF(cached["centroids"], cached["list_rows"], cached["list_offsets"])
+                return self._ivf
+        nlist = nlist or max(1, int(np.sqrt(self.count)))
+        self._ivf = _IVF.build(self.matrix[:self.count], nlist)
+        np.savez(
+            ivf_path,
+            version=self.version,
+            centroids=self._ivf.centroids,
+            list_rows=self._ivf.list_rows,
+            list_offsets=self._ivf.list_offsets,
+        )
+        return self._ivf
+
+    def quantizer(self, kind: str, tolerance: float = RECALL_TOLERANCE):
+        """
+        Quantized codes for the current rows, or None (exact scan) until
+        update_quantizer() / train_quantizer() has trained and calibrated them
+        for `tolerance`. Nothing is trained or calibrated on the query path.
+        """
+        if (self._quantizer is None or self._quantizer.kind != kind) and self._quantizer_miss != (kind, self.version):
+            self._quantizer = self._load_quantizer(kind)
+            if self._quantizer is None:
+                # Not looked for again until the rows change
+                self._quantizer_miss = (kind, self.version)
+        if self._quantizer is None or self.calibration["tolerance"] != tolerance:
+            return None
+        self.shortlist_factor = self.calibration["shortlist_factor"]
+        return self._quantizer
+
+    def _load_quantizer(self, kind: str):
+        """The saved codes of `kind`, if saved at the current version (rows written since make them stale)."""
+        quant_path = os.path.join(self.path, QUANT_FILE.format(kind))
+        if not os.path.exists(quant_path):
+            return None
+        cached = np.load(quant_path)
+        self.calibration = {
+            "kind": kind,
+            "tolerance": float(cached["tolerance"]),
+            "shortlist_factor": int(cached["shortlist_factor"]) or None,
+            "recall": float(cached["recall"]),
+        }
+        if int(cached["version"]) != self.version:
+            return None
+        return QUANTIZERS[kind].load(cached)
+
+    def update_quantizer(self, kind: str, tolerance: float = RECALL_TOLERANCE):
+        """
+        Bring the saved codes up to date after an ingest: the first time they
+        are trained, afterwards new rows are encoded with the existing model
+        (no retraining) and only the shortlist is recalibrated when the
+        tolerance changed.
+        """
+        with self.lock:
+            if self.count < QUANT_MIN_ROWS:
+                return None
+            if self._quantizer is None or self._quantizer.kind != kind:
+                quant_path = os.path.join(self.path, QUANT_FILE.format(kind))
+                if not os.path.exists(quant_path):
+                    return self.train_quantizer(kind, tolerance)
+                # Codes written by an earlier run: keep its model, re-encode the current rows
+                self._quantizer = self._load_quantizer(kind) or QUANTIZERS[kind].load(np.load(quant_path)).reencode(
+                    self.matrix[:self.count]
+                )
+            if self.calibration["tolerance"] != tolerance:
+                self._calibrate(tolerance)
+            self._save_quantizer()
+            self.shortlist_factor = self.calibration["shortlist_factor"]
+            return self._quantizer
+
+    def train_quantizer(self, kind: str, tolerance: float = RECALL_TOLERANCE):
+        """Train the quantizer on the current rows, calibrate its shortlist and save both."""
+        with self.lock:
+            self._quantizer = QUANTIZERS[kind].build(self.matrix[:self.count])
+            self._calibrate(tolerance)
+            self._save_quantizer()
+            self.shortlist_factor = self.calibration["shortlist_factor"]
+            return self._quantizer
+
+    def _calibrate(self, tolerance: float):
+        factor, recall = self.calibrate(self._quantizer, tolerance)
+        self.calibration = {
+            "kind": self._quantizer.kind,
+            "tolerance": tolerance,
+            "shortlist_factor": factor,
+            "recall": recall,
+        }
+
+    def _save_quantizer(self):
+        np.savez(
+            os.path.join(self.path, QUANT_FILE.format(self._quantizer.kind)),
+            version=self.version,
+            tolerance=self.calibration["tolerance"],
+            shortlist_factor=self.calibration["shortlist_factor"] or 0,
+            recall=self.calibration["recall"],
+            **self._quantizer.arrays(),
+        )
+
+    def calibrate(self, quantizer, tolerance: float, queries: int = 64, seed: int = 0):
+        """
+        Smallest shortlist (as a multiple of top_k) whose re-scored top RECALL_K
+        keeps recall within `tolerance` of the exact search, or None when no
+        shortlist in SHORTLIST_FACTORS does (the search then stays exact).
+        Sampled stored vectors stand in for queries, each held out of its own
+        ranking so it cannot find itself.
+        """
+        matrix = self.matrix[:self.count]
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(self.count, size=min(queries, self.count), replace=False))
+        samples = []
+        for row in sample_rows:
+            query = np.asarray(matrix[row])
+            exact = np.asarray(matrix @ query)
+            approx = quantizer.scores(query)
+            exact[row] = approx[row] = -np.inf
+            samples.append((query, set(_top_k(exact, RECALL_K)), approx))
+
+        recall = 0.0
+        for factor in SHORTLIST_FACTORS:
+            hits = 0
+            for query, truth, approx in samples:
+                shortlist = np.sort(_top_k(approx, factor * RECALL_K))
+                best = shortlist[_top_k(matrix[shortlist] @ query, RECALL_K)]
+                hits += len(truth.intersection(best))
+            recall = hits / (len(samples) * RECALL_K)
+            if recall >= 1 - tolerance:
+                return factor, recall
+        return None, recall
+
+    def _rows_for(self, field: str, values: List[Any]) -> np.ndarray:
+        if field not in self._value_index:
+            index: Dict[Any, List[int]] = {}
+            for row, metadata in enumerate(self.metadata):
+                value = metadata.get(field)
+                if isinstance(value, (str, int, float, bool)):
+                    index.setdefault(value, []).append(row)
+            self._value_index[field] = index
+        rows = [row for value in values for row in self._value_index[field].get(value, [])]
+        return np.unique(np.asarray(rows, dtype=np.int64))
+
+    def filter_rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Rows whose metadata satisfies `filter`, narrowed through the value index first."""
+        rows = None
+        for field, values in _equality_terms(filter):
+            field_rows = self._rows_for(field, values)
+            rows = field_rows if rows is None else np.intersect1d(rows, field_rows)
+        if rows is None:
+            rows = np.arange(self.count)
+        return np.asarray([row for row in rows if matches_filter(self.metadata[row], filter)], dtype=np.int64)
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        mode: str,
+        nprobe: int,
+        filter: Optional[Dict[str, Any]] = None,
+        quantization: str = "none",
+        tolerance: float = RECALL_TOLERANCE,
+    ):
+        with self.lock:
+            if self.count == 0:
+                return [], []
+            if mode not in ("exact", "ivf"):
+                raise ValueError(f"Unknown search mode: {mode}")
+            if quantization != "none" and quantization not in QUANTIZERS:
+                raise ValueError(f"Unknown quantization: {quantization}")
+
+            if filter:
+                # Pre-filter: only the matching subset is scored
+                rows = self.filter_rows(filter)
+                if mode == "ivf" and len(rows) >= IVF_MIN_ROWS:
+                    rows = np.intersect1d(rows, self.ivf().candidates(query, nprobe))
+            elif mode == "ivf" and self.count >= IVF_MIN_ROWS:
+                rows = self.ivf().candidates(query, nprobe)
+            else:
+                rows = None
+
+            # Without a calibrated shortlist (recall out of tolerance) the scan stays exact
+            quantizer = self.quantizer(quantization, tolerance) if quantization != "none" and self.count >= QUANT_MIN_ROWS else None
+            if quantizer is not None and self.shortlist_factor:
+                shortlist = top_k * self.shortlist_factor
+                if shortlist < (self.count if rows is None else len(rows)):
+                    # Approximate scores on the codes pick the rows worth an exact score
+                    short = np.sort(_top_k(quantizer.scores(query, rows), shortlist))
+                    rows = short if rows is None else rows[short]
+
+            if rows is None:
+                scores = self.matrix[:self.count] @ query
+                best = _top_k(scores, top_k)
+                return best, scores[best]
+
+            if len(rows) == 0:
+                return [], []
+            scores = self.matrix[rows] @ query
+            best = _top_k(scores, top_k)
+            return rows[best], scores[best]
+
+
+class LocalIndex:
+    """
+    Drop-in offline replacement for `Pinecone(...).Index("rag")`.
+    Vectors are L2-normalised on write, so scores are cosine similarities
+    like the Pinecone cosine index.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_INDEX_DIR,
+        mode: str = DEFAULT_MODE,
+        nprobe: int = 8,
+        quantization: str = DEFAULT_QUANTIZATION,
+        recall_tolerance: float = RECALL_TOLERANCE,
+    ):
+        self.path = path
+        self.mode = mode
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.recall_tolerance = recall_tolerance
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+
+    def _namespace(self, namespace: str) -> _Namespace:
+        with self._lock:
+            if namespace not in self._namespaces:
+                self._namespaces[namespace] = _Namespace(
+                    os.path.join(self.path, namespace or "__default__")
+                )
+            return self._namespaces[namespace]
+
+    def upsert(self, vectors, namespace: str = "") -> Dict[str, int]:
+        return {"upserted_count": self._namespace(namespace).upsert(vectors)}
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = "", delete_all: bool = False):
+        self._namespace(namespace).delete(ids, delete_all=delete_all)
+        return {}
+
+    def update_quantizer(self, namespace: str = "", quantization: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Train (first time) or refresh the namespace's quantized codes; ingestion
+        calls this once its upserts are done, so queries never train. Returns
+        the calibration, or None when quantization is off or the namespace is
+        too small to need it.
+        """
+        quantization = quantization or self.quantization
+        if quantization == "none":
+            return None
+        if quantization not in QUANTIZERS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        ns = self._namespace(namespace)
+        if ns.update_quantizer(quantization, self.recall_tolerance) is None:
+            return None
+        return dict(ns.calibration)
+
+    def train_quantizer(self, namespace: str = "", quantization: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Retrain the namespace's quantized codes on its current rows. Upserts
+        only encode new rows with the existing model, so run this after large
+        changes to the corpus.
+        """
+        quantization = quantization or self.quantization
+        if quantization not in QUANTIZERS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        ns = self._namespace(namespace)
+        ns.train_quantizer(quantization, self.recall_tolerance)
+        return dict(ns.calibration)
+
+    def fetch(self, ids: List[str], namespace: str = "") -> Dict[str, Any]:
+        ns = self._namespace(namespace)
+        with ns.lock:
+            vectors = {}
+            for vid in ids:
+                row = ns.row_of.get(vid)
+                if row is not None:
+                    vectors[vid] = {
+                        "id": vid,
+                        "values": ns.matrix[row].tolist(),
+                        "metadata": ns.metadata[row],
+                    }
+        return {"namespace": namespace, "vectors": vectors}
+
+    def query(
+        self,
+        vector,
+        top_k: int = 10,
+        namespace: str = "",
+        include_metadata: bool = False,
+        include_values: bool = False,
+        filter: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        quantization: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        ns = self._namespace(namespace)
+        with ns.lock:
+            rows, scores = ns.search(
+                query,
+                top_k,
+                mode or self.mode,
+                nprobe or self.nprobe,
+                filter,
+                quantization or self.quantization,
+                self.recall_tolerance,
+            )
+            matches = []
+            for row, score in zip(rows, scores):
+                match = {"id": ns.ids[row], "score": float(score)}
+                if include_metadata:
+                    match["metadata"] = ns.metadata[row]
+                if include_values:
+                    match["values"] = ns.matrix[row].tolist()
+                matches.append(match)
+        return {"namespace": namespace, "matches": matches}
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        namespaces = {}
+        if os.path.isdir(self.path):
+            for name in sorted(os.listdir(self.path)):
+                if any(os.path.exists(os.path.join(self.path, name, f)) for f in (META_FILE, META_LOG_FILE)):
+                    ns = self._namespace("" if name == "__default__" else name)
+                    namespaces[name] = {"vector_count": ns.count}
+                    if ns.calibration is not None:
+                        # Recall measured at calibration time; shortlist_factor None means exact scans
+                        namespaces[name]["quantization"] = dict(ns.calibration)
+        return {
+            "namespaces": namespaces,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values()),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Retrain the quantized codes of local index namespaces.")
+    parser.add_argument("namespaces", nargs="*", help="namespaces to retrain (default: all)")
+    parser.add_argument("--quantization", choices=sorted(QUANTIZERS), default=None if DEFAULT_QUANTIZATION == "none" else DEFAULT_QUANTIZATION)
+    args = parser.parse_args()
+    if args.quantization is None:
+        parser.error("set --quantization or LOCAL_INDEX_QUANTIZATION")
+
+    index = LocalIndex(quantization=args.quantization)
+    for name in args.namespaces or list(index.describe_index_stats()["namespaces"]):
+        print(name, index.train_quantizer("" if name == "__default__" else name))
@@ -0,0 +1,250 @@
+from typing import Any, Dict, List, Optional
+import json
+import os
+import time
+import numpy as np
+
+# --------------------------------------------------
+# ONNX EMBEDDING BACKEND
+# all-mpnet-base-v2 exported to ONNX (optimum), dynamically quantized to
+# int8 (onnxruntime) and run on CPU with a fixed intra-op thread count.
+# Mean pooling + L2 normalisation reproduce the sentence-transformers
+# pipeline, and embed_query / embed_documents match HuggingFaceEmbeddings,
+# so awsRAG and both embedders can use either backend.
+#
+#   python onnxEmbeddings.py     # export, quantize and record parity vs PyTorch
+#
+# The backend refuses to load until that report has been recorded for the
+# exact model file and meets ONNX_PARITY_MIN_COSINE / ONNX_PARITY_MIN_RECALL.
+# --------------------------------------------------
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "data/models/all-mpnet-base-v2-onnx")
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "1") == "1"
+# 0 = one thread per available core
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+# sentence-transformers truncates all-mpnet-base-v2 inputs at 384 tokens
+MAX_SEQ_LENGTH = 384
+
+# Floors the recorded report must meet: worst-corpus p1 cosine and recall@6 vs PyTorch
+ONNX_PARITY_MIN_COSINE = float(os.getenv("ONNX_PARITY_MIN_COSINE", "0.98"))
+ONNX_PARITY_MIN_RECALL = float(os.getenv("ONNX_PARITY_MIN_RECALL", "0.9"))
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+PARITY_FILE = "parity_report.json"
+
+
+def export_model(model_name: str, directory: str = ONNX_MODEL_DIR, quantize: bool = ONNX_QUANTIZE) -> str:
+    """Export `model_name` once (and quantize it once); returns the .onnx path to load."""
+    fp32_path = os.path.join(directory, FP32_FILE)
+    if not os.path.exists(fp32_path):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        print(f"Exporting {model_name} to ONNX in {directory}")
+        ORTModelForFeatureExtraction.from_pretrained(model_name, export=True).save_pretrained(directory)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(directory)
+
+    if not quantize:
+        return fp32_path
+
+    int8_path = os.path.join(directory, INT8_FILE)
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"Quantizing {fp32_path} to int8")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+def check_parity(model_path: str, directory: str = ONNX_MODEL_DIR):
+    """Raise unless a parity report for `model_path` is recorded and within the floors."""
+    report_path = os.path.join(directory, PARITY_FILE)
+    rerun = "Run `python onnxEmbeddings.py` to record it, or use EMBEDDING_BACKEND=torch."
+    if not os.path.exists(report_path):
+        raise RuntimeError(f"No ONNX parity report in {report_path}. {rerun}")
+    with open(report_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    if os.path.basename(report.get("onnx_model", "")) != os.path.basename(model_path):
+        raise RuntimeError(f"{report_path} was recorded for {report.get('onnx_model')}, not {model_path}. {rerun}")
+
+    cosine = min(corpus["cosine_p1"] for corpus in report["corpora"].values())
+    recall = report["recall@6"]
+    if cosine < ONNX_PARITY_MIN_COSINE or recall < ONNX_PARITY_MIN_RECALL:
+        raise RuntimeError(
+            f"ONNX parity below the floors (cosine p1 {cosine} < {ONNX_PARITY_MIN_COSINE} "
+            f"or recall@6 {recall} < {ONNX_PARITY_MIN_RECALL}); use EMBEDDING_BACKEND=torch "
+            "or ONNX_QUANTIZE=0 and re-run the report."
+        )
+
+
+def prepare_model(model_name: str, directory: str = ONNX_MODEL_DIR, quantize: bool = ONNX_QUANTIZE, require_parity: bool = True) -> str:
+    """Export / quantize once and check its recorded parity; call before starting worker processes."""
+    model_path = export_model(model_name, directory, quantize)
+    if require_parity:
+        check_parity(model_path, directory)
+    return model_path
+
+
+class OnnxEmbeddings:
+    def __init__(
+        self,
+        model_name: str,
+        directory: str = ONNX_MODEL_DIR,
+        quantize: bool = ONNX_QUANTIZE,
+        threads: int = ONNX_THREADS,
+        batch_size: int = 32,
+        max_length: int = MAX_SEQ_LENGTH,
+        require_parity: bool = True,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        from embeddingModel import available_cores
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model_path = prepare_model(model_name, directory, quantize, require_parity)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length)
+        self.pad_id = self._pad_id(directory)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or available_cores()
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _pad_id(self, directory: str) -> int:
+        config_path = os.path.join(directory, "config.json")
+        if os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                pad_id = json.load(f).get("pad_token_id")
+            if pad_id is not None:
+                return int(pad_id)
+        return self.tokenizer.token_to_id("<pad>") or 0
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        length = max(len(e.ids) for e in encodings)
+        input_ids = np.full((len(texts), length), self.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(texts), length), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, :len(encoding.ids)] = encoding.ids
+            attention_mask[row, :len(encoding.ids)] = 1
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        # Mean pooling over real tokens, then unit length like the Normalize module
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Longest first so each batch pads to similar lengths, then back to input order
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        vectors: List[List[float]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._encode_batch([texts[i] for i in batch]).tolist()):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode_batch([text])[0].tolist()
+
+
+# --------------------------------------------------
+# PARITY REPORT
+# --------------------------------------------------
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _median_query_secs(embeddings, queries: List[str]) -> float:
+    embeddings.embed_query(queries[0])
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        embeddings.embed_query(query)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def parity_report(reference, candidate, corpora: Dict[str, List[str]], queries: List[str], top_k: int = 6) -> Dict[str, Any]:
+    """Cosine agreement per corpus and recall@top_k of candidate neighbours against reference ones."""
+    report: Dict[str, Any] = {"corpora": {}}
+    ref_all, cand_all = [], []
+    for name, texts in corpora.items():
+        ref = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+        cand = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+        cosine = (ref * cand).sum(axis=1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(cand, axis=1))
+        report["corpora"][name] = {
+            "texts": len(texts),
+            "cosine_min": round(float(cosine.min()), 5),
+            "cosine_p1": round(float(np.percentile(cosine, 1)), 5),
+            "cosine_mean": round(float(cosine.mean()), 5),
+        }
+        ref_all.append(ref)
+        cand_all.append(cand)
+
+    # Same queries against the whole corpus: do both backends retrieve the same chunks?
+    ref_docs, cand_docs = np.vstack(ref_all), np.vstack(cand_all)
+    recalls = []
+    for query in queries:
+        ref_top = np.argsort(-(ref_docs @ np.asarray(reference.embed_query(query))))[:top_k]
+        cand_top = np.argsort(-(cand_docs @ np.asarray(candidate.embed_query(query))))[:top_k]
+        recalls.append(len(set(ref_top) & set(cand_top)) / top_k)
+    report[f"recall@{top_k}"] = round(float(np.mean(recalls)), 4)
+    report["queries"] = len(queries)
+    return report
+
+
+if __name__ == "__main__":
+    from embeddingModel import EMBEDDING_MODEL_NAME, load_embeddings
+    from embedTickets import to_documents_per_object
+    from embedUserGuides import PDFSectionChunker
+
+    with open("data/text_files/IAMtickets.json", "r", encoding="utf-8") as f:
+        records = json.load(f)
+    tickets = [doc.page_content for doc in to_documents_per_object(records, source="IAMtickets.json")]
+    guide = [doc.page_content for doc in PDFSectionChunker().process_pdf("data/pdf/AWSecsUserGuide_modified.pdf")]
+    queries = [r["symptom"] for r in records if r.get("symptom")] + [
+        "Why is AssumeRole failing?",
+        "ECS task stopped with CannotPullContainerError",
+        "How do I give an ECS task permission to read from S3?",
+    ]
+
+    rss = _rss_mb()
+    onnx_embeddings = OnnxEmbeddings(EMBEDDING_MODEL_NAME, require_parity=False)
+    onnx_rss = _rss_mb()
+    torch_embeddings = load_embeddings(backend="torch")
+    torch_rss = _rss_mb()
+
+    report = parity_report(torch_embeddings, onnx_embeddings, {"tickets": tickets, "user_guide": guide}, queries)
+    report["query_secs_torch"] = round(_median_query_secs(torch_embeddings, queries), 5)
+    report["query_secs_onnx"] = round(_median_query_secs(onnx_embeddings, queries), 5)
+    if rss is not None:
+        report["rss_mb_onnx"] = round(onnx_rss - rss, 1)
+        report["rss_mb_torch"] = round(torch_rss - onnx_rss, 1)
+    report["onnx_model"] = onnx_embeddings.model_path
+    print(json.dumps(report, indent=2))
+
+    # The backend only loads against a recorded report
+    with open(os.path.join(ONNX_MODEL_DIR, PARITY_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
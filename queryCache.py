@@ -0,0 +1,139 @@
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+
+# --------------------------------------------------
+# QUERY EMBEDDING CACHE
+# In-process LRU in front of a persistent SQLite tier, keyed by model name
+# plus normalised query text, so repeated RAG questions skip the model.
+# --------------------------------------------------
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_DISK_SIZE = int(os.getenv("QUERY_CACHE_DISK_SIZE", "100000"))
+# Empty string keeps the cache in memory only
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "data/cache/query_embeddings.sqlite")
+# A full disk tier is trimmed to this share of its capacity, so eviction runs once per 10% of new rows
+QUERY_CACHE_DISK_LOW_WATER = 0.9
+
+
+def normalize_query(query: str) -> str:
+    # Case is kept: it can change the embedding, so it must stay part of the key
+    return " ".join(unicodedata.normalize("NFKC", query).split())
+
+
+class QueryEmbeddingCache:
+    def __init__(
+        self,
+        model_name: str,
+        capacity: int = QUERY_CACHE_SIZE,
+        path: Optional[str] = QUERY_CACHE_PATH,
+        disk_capacity: int = QUERY_CACHE_DISK_SIZE,
+    ):
+        self.model_name = model_name
+        self.capacity = capacity
+        self.disk_capacity = disk_capacity
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        self._db = None
+        # Rows in the disk tier, kept in memory instead of a COUNT(*) per insert
+        self._disk_rows = 0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT, query TEXT, vector BLOB, created REAL)"
+            )
+            self._db.commit()
+            (self._disk_rows,) = self._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+
+    def _key(self, query: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def get(self, query: str) -> Optional[List[float]]:
+        key = self._key(query)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counters["hits"] += 1
+                return self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                    self._remember(key, vector)
+                    self._counters["disk_hits"] += 1
+                    return vector
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, query: str, vector: List[float]):
+        key = self._key(query)
+        with self._lock:
+            self._remember(key, list(vector))
+            if self._db is None:
+                return
+            model, text, blob, created = (
+                self.model_name, normalize_query(query), np.asarray(vector, dtype=np.float32).tobytes(), time.time()
+            )
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO query_embeddings VALUES (?, ?, ?, ?, ?)",
+                (key, model, text, blob, created),
+            ).rowcount
+            if inserted:
+                self._disk_rows += 1
+            else:
+                self._db.execute(
+                    "UPDATE query_embeddings SET model = ?, query = ?, vector = ?, created = ? WHERE key = ?",
+                    (model, text, blob, created, key),
+                )
+            if self._disk_rows > self.disk_capacity:
+                self._evict_disk()
+            self._db.commit()
+
+    def _evict_disk(self):
+        # Recount first: other processes may share the file
+        (rows,) = self._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+        keep = int(self.disk_capacity * QUERY_CACHE_DISK_LOW_WATER)
+        if rows > self.disk_capacity:
+            self._db.execute(
+                "DELETE FROM query_embeddings WHERE key IN "
+                "(SELECT key FROM query_embeddings ORDER BY created LIMIT ?)",
+                (rows - keep,),
+            )
+            self._counters["disk_evictions"] += rows - keep
+            rows = keep
+        self._disk_rows = rows
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._memory)
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else None
+        return stats
@@ -0,0 +1,102 @@
+from typing import Any, Dict, List
+import os
+import re
+from lexicalIndex import STOP_WORDS, exact_tokens
+
+# --------------------------------------------------
+# DETERMINISTIC QUERY NORMALIZER
+# Rewrites a user problem into a retrieval query without an LLM call:
+# error codes, AWS services and IAM entities first, then the remaining
+# content words. The confidence decides whether the agent can go straight
+# to retrieval or still needs the LLM planner.
+# --------------------------------------------------
+
+# Below this the agent falls back to the rag_planner LLM
+QUERY_FAST_PATH_MIN_CONFIDENCE = float(os.getenv("QUERY_FAST_PATH_MIN_CONFIDENCE", "0.6"))
+
+# Longer messages usually describe several problems; leave those to the LLM
+MAX_FAST_PATH_WORDS = 80
+
+AWS_SERVICES = {
+    "iam": "IAM", "sts": "STS", "ec2": "EC2", "ecs": "ECS", "eks": "EKS", "ecr": "ECR",
+    "s3": "S3", "lambda": "Lambda", "kms": "KMS", "rds": "RDS", "vpc": "VPC",
+    "cloudwatch": "CloudWatch", "cloudtrail": "CloudTrail", "fargate": "Fargate",
+    "sso": "SSO", "organizations": "Organizations", "secretsmanager": "SecretsManager",
+}
+
+# Conversational words that add nothing to a retrieval query
+FILLER_WORDS = frozenset("""
+am getting get got trying try tried keeps keep help fix solve resolve issue problem anyone
+mentions mention says saying seeing see happening happens suddenly now today also just
+""".split())
+
+ARN_RE = re.compile(r"\barn:aws[\w-]*:[\w-]*:[\w-]*:\d{0,12}:[\w+=,.@/:*-]+")
+ACCOUNT_RE = re.compile(r"(?<![\w:])\d{12}(?![\w:])")
+# "role Prod-App-Role", "policy ReadOnlyAccess", "user build-bot" ...
+ENTITY_RE = re.compile(
+    r"\b(role|user|group|policy|instance profile|bucket|cluster|service)\s+['\"`]?([A-Za-z0-9][\w+=,.@-]*[\w])['\"`]?",
+    re.IGNORECASE,
+)
+WORD_RE = re.compile(r"[A-Za-z0-9][\w:/.*-]*[\w*]|[A-Za-z0-9]")
+
+
+def _unique(items: List[str]) -> List[str]:
+    seen, unique = set(), []
+    for item in items:
+        if item.lower() not in seen:
+            seen.add(item.lower())
+            unique.append(item)
+    return unique
+
+
+def normalize(query: str) -> Dict[str, Any]:
+    """Rewritten retrieval query, the signals found in it and a 0..1 confidence."""
+    arns = ARN_RE.findall(query)
+    remaining = ARN_RE.sub(" ", query)
+    named = [
+        (kind.lower(), name) for kind, name in ENTITY_RE.findall(remaining)
+        if name.lower() not in STOP_WORDS and name.lower() not in FILLER_WORDS
+    ]
+    names = {name.lower() for _, name in named}
+
+    # Resource names such as Prod-App-Role look like CamelCase codes; they are entities
+    error_codes = _unique([
+        m.group(0) for m in WORD_RE.finditer(remaining)
+        if m.group(0).lower() in exact_tokens(m.group(0)) and m.group(0).lower() not in names
+    ])
+    # sts:AssumeRole names its service, so does arn:aws:ecr:...
+    prefixes = [arn.split(":")[2] for arn in arns] + [w.split(":")[0].lower() for w in WORD_RE.findall(remaining)]
+    services = _unique([AWS_SERVICES[p] for p in prefixes if p in AWS_SERVICES])
+    entities = _unique(arns + ACCOUNT_RE.findall(remaining) + [f"{kind} {name}" for kind, name in named])
+
+    signal = {w.lower() for w in error_codes + services}
+    words = _unique([
+        w for w in WORD_RE.findall(remaining)
+        if w.lower() not in STOP_WORDS
+        and w.lower() not in FILLER_WORDS
+        and w.lower() not in signal
+        and w.lower() not in AWS_SERVICES
+        and w.lower() not in names
+    ])
+
+    rewritten = " ".join(_unique(services + error_codes + entities + words))
+
+    confidence = 0.0
+    if error_codes:
+        confidence += 0.4
+    if services:
+        confidence += 0.2
+    if entities:
+        confidence += 0.2
+    if len(words) >= 3:
+        confidence += 0.2
+    if len(query.split()) > MAX_FAST_PATH_WORDS or not (error_codes or services):
+        confidence = min(confidence, 0.3)
+
+    return {
+        "query": rewritten or " ".join(query.split()),
+        "error_codes": error_codes,
+        "services": services,
+        "entities": entities,
+        "confidence": round(confidence, 2),
+    }
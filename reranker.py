@@ -0,0 +1,99 @@
+from typing import Any, Dict, List, Optional
+import os
+import threading
+import numpy as np
+from lexicalIndex import tokenize, exact_tokens, STOP_WORDS
+
+# --------------------------------------------------
+# LOCAL RERANKER
+# Orders and trims retrieved chunks inside the RAG tool on CPU, so the LLM
+# only ever sees the top few instead of ranking them itself.
+# --------------------------------------------------
+
+# fusion | cross-encoder | none
+RERANKER = os.getenv("RERANKER", "fusion")
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+# Weights of the score-fusion model: dense cosine, relative BM25,
+# query-term coverage and exact error-code match
+FUSION_WEIGHTS = {"dense": 0.5, "lexical": 0.2, "coverage": 0.2, "exact": 0.1}
+
+
+def _text(match: Dict[str, Any]) -> str:
+    return (match.get("metadata") or {}).get("text", "")
+
+
+class ScoreFusionReranker:
+    """Linear model over the retrieval scores plus cheap term-overlap features."""
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.weights = weights or FUSION_WEIGHTS
+
+    def score(self, query: str, matches: List[Dict[str, Any]]) -> List[float]:
+        terms = {t for t in tokenize(query) if t not in STOP_WORDS}
+        exact = exact_tokens(query)
+        max_lexical = max((m.get("lexical_score") or 0.0 for m in matches), default=0.0)
+
+        scores = []
+        for match in matches:
+            tokens = set(tokenize(_text(match)))
+            features = {
+                "dense": match.get("dense_score") or 0.0,
+                "lexical": (match.get("lexical_score") or 0.0) / max_lexical if max_lexical else 0.0,
+                "coverage": len(terms & tokens) / len(terms) if terms else 0.0,
+                "exact": 1.0 if exact and all(t in tokens for t in exact) else 0.0,
+            }
+            scores.append(sum(self.weights[name] * value for name, value in features.items()))
+        return scores
+
+
+class CrossEncoderReranker:
+    """
+    Small cross-encoder scoring (query, chunk) pairs; loaded on first use.
+    Its logits go through a sigmoid, so scores are on the same [0, 1] scale
+    as the fusion reranker's.
+    """
+
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def score(self, query: str, matches: List[Dict[str, Any]]) -> List[float]:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        logits = self._model.predict([(query, _text(m)) for m in matches])
+        return [float(1 / (1 + np.exp(-s))) for s in logits]
+
+
+_rerankers: Dict[str, Any] = {}
+_rerankers_lock = threading.Lock()
+
+
+def get_reranker(kind: str = RERANKER):
+    with _rerankers_lock:
+        if kind not in _rerankers:
+            if kind == "fusion":
+                _rerankers[kind] = ScoreFusionReranker()
+            elif kind == "cross-encoder":
+                _rerankers[kind] = CrossEncoderReranker()
+            else:
+                raise ValueError(f"Unknown reranker: {kind}")
+        return _rerankers[kind]
+
+
+def rerank(query: str, matches: List[Dict[str, Any]], top_n: int = RERANK_TOP_N, kind: str = RERANKER) -> List[Dict[str, Any]]:
+    """Return the `top_n` best matches, best first, each with a "rerank_score" in [0, 1]."""
+    if kind == "none" or not matches:
+        return matches[:top_n]
+
+    scores = get_reranker(kind).score(query, matches)
+    ranked = sorted(zip(scores, range(len(matches))), key=lambda item: item[0], reverse=True)
+    return [
+        {**matches[i], "rerank_score": score}
+        for score, i in ranked[:top_n]
+    ]
@@ -0,0 +1,144 @@
+from typing import Any, Optional, Tuple
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# --------------------------------------------------
+# SQLITE CHECKPOINTER
+# Disk-backed LangGraph checkpointer for the agent. Checkpoints are zlib
+# compressed, only the newest few per thread are kept, and whole threads
+# are evicted once idle for CHECKPOINT_TTL_SECONDS or when more than
+# CHECKPOINT_MAX_THREADS exist, so memory and disk stay bounded.
+# --------------------------------------------------
+
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "data/cache/agent_checkpoints.sqlite")
+# Checkpoints kept per thread; the newest one is all a resume needs
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "2"))
+CHECKPOINT_TTL_SECONDS = float(os.getenv("CHECKPOINT_TTL_SECONDS", str(7 * 24 * 3600)))
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000"))
+# Run thread eviction at most this often
+CHECKPOINT_EVICT_INTERVAL = float(os.getenv("CHECKPOINT_EVICT_INTERVAL", "60"))
+
+# Payloads smaller than this are stored as is
+COMPRESS_MIN_BYTES = 512
+COMPRESSED_PREFIX = "zlib+"
+
+
+class CompressedSerializer:
+    """Wraps a typed serializer and zlib-compresses its larger payloads."""
+
+    def __init__(self, serde=None, level: int = 6, min_bytes: int = COMPRESS_MIN_BYTES):
+        self.serde = serde or JsonPlusSerializer()
+        self.level = level
+        self.min_bytes = min_bytes
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) < self.min_bytes:
+            return type_, data
+        return COMPRESSED_PREFIX + type_, zlib.compress(data, self.level)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.startswith(COMPRESSED_PREFIX):
+            return self.serde.loads_typed((type_[len(COMPRESSED_PREFIX):], zlib.decompress(payload)))
+        return self.serde.loads_typed((type_, payload))
+
+
+class EvictingSqliteSaver(SqliteSaver):
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        keep_last: int = CHECKPOINT_KEEP_LAST,
+        ttl_seconds: float = CHECKPOINT_TTL_SECONDS,
+        max_threads: int = CHECKPOINT_MAX_THREADS,
+        evict_interval: float = CHECKPOINT_EVICT_INTERVAL,
+    ):
+        super().__init__(conn, serde=CompressedSerializer())
+        self.keep_last = max(1, keep_last)
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.evict_interval = evict_interval
+        self._last_evict = 0.0
+        self._evict_lock = threading.Lock()
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS thread_activity_updated ON thread_activity (updated);
+            """
+        )
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, updated) VALUES (?, ?)",
+                (thread_id, time.time()),
+            )
+            # Older checkpoint versions (and their pending writes) are never resumed from
+            cur.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN "
+                "(SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT ?)",
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep_last),
+            )
+            if cur.rowcount:
+                cur.execute(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN "
+                    "(SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?)",
+                    (thread_id, checkpoint_ns, thread_id, checkpoint_ns),
+                )
+
+        if time.time() - self._last_evict >= self.evict_interval:
+            self.evict()
+        return saved
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """Delete idle threads and the least recently used ones over max_threads."""
+        if not self._evict_lock.acquire(blocking=False):
+            return 0
+        try:
+            now = time.time() if now is None else now
+            self._last_evict = now
+            with self.cursor(transaction=False) as cur:
+                expired = [row[0] for row in cur.execute(
+                    "SELECT thread_id FROM thread_activity WHERE updated < ?",
+                    (now - self.ttl_seconds,),
+                )]
+                overflow = [row[0] for row in cur.execute(
+                    "SELECT thread_id FROM thread_activity WHERE updated >= ? "
+                    "ORDER BY updated DESC LIMIT -1 OFFSET ?",
+                    (now - self.ttl_seconds, self.max_threads),
+                )]
+
+            for thread_id in expired + overflow:
+                self.delete_thread(thread_id)
+            return len(expired) + len(overflow)
+        finally:
+            self._evict_lock.release()
+
+
+def open_checkpointer(path: str = CHECKPOINT_DB_PATH, **kwargs) -> EvictingSqliteSaver:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return EvictingSqliteSaver(conn, **kwargs)
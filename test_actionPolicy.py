@@ -0,0 +1,98 @@
+import pytest
+
+from actionPolicy import PRIVILEGED_RESOURCE_RE, classify_action, parse_diagnosis
+
+# (action, configuration item, user request, verb, reversible, highImpact, reason)
+CLASSIFICATIONS = [
+    # Prompt examples
+    ("Remove the AdministratorAccess policy from IAM role Prod-Admin-Role", "Prod-Admin-Role", "", "revoke", True, True, "privileged resource"),
+    ("Attach the policy AmazonS3FullControl to IAM role Prod-App-Role", "Prod-App-Role", "", "grant", True, True, "privileged resource"),
+    ("Permanently delete IAM role Prod-App-Role used by production EC2 instances", "Prod-App-Role", "", "destroy", False, True, "production"),
+    ("Attach the policy AmazonS3ReadOnlyAccess to IAM role Dev-App-Role", "Dev-App-Role", "", "grant", True, False, "non-production"),
+    # Grants and changes on untagged resources need approval
+    ("Update the trust policy of role Billing-Role to allow Principal *", "Billing-Role", "", "grant", True, True, "privileged resource"),
+    ("Attach a policy allowing s3:*", "App-Role", "", "grant", True, True, "privileged resource"),
+    ("Update the bucket policy to make the bucket public", "billing-reports", "", "change", True, True, "privileged resource"),
+    ("Create an access key for IAM user admin", "admin", "", "grant", True, True, "privileged resource"),
+    ("Attach the policy AmazonS3ReadOnlyAccess to IAM role Billing-Role", "Billing-Role", "", "grant", True, True, "untagged"),
+    # Environment words in the user's prose do not tag the resource
+    ("Permanently delete IAM user contractor-temp-user", "contractor-temp-user", "We tested this in qa and on the demo stage", "destroy", False, True, "untagged"),
+    ("Restart the service", "orders-api", "this is only a test", "change", True, True, "untagged"),
+    # Tags in the configuration item and in resource names
+    ("Stop the instance", "ProdDatabase", "", "revoke", True, True, "production"),
+    ("Stop the instance", "ordersProdDb", "", "revoke", True, True, "production"),
+    ("Stop the instance", "ORDERS_PROD", "", "revoke", True, True, "production"),
+    ("Detach the policy from role app_qa", "", "", "revoke", True, False, "non-production"),
+    ("Restart the service", "test1-worker", "", "change", True, False, "non-production"),
+    ("Update the role", "products-role", "", "change", True, True, "untagged"),
+    ("Update the role", "DevOpsRole", "", "change", True, True, "untagged"),
+    # A prod tag wins over a non-prod one
+    ("Update the role", "prod-test-role", "", "change", True, True, "production"),
+    ("Update role Dev-Role to trust Prod-Deploy-Role", "Dev-Role", "", "change", True, True, "production"),
+]
+
+
+@pytest.mark.parametrize("action, configuration_item, user_request, verb, reversible, high_impact, reason", CLASSIFICATIONS)
+def test_classify_action(action, configuration_item, user_request, verb, reversible, high_impact, reason):
+    flags = classify_action(action, configuration_item, user_request)
+    assert flags == {"verb": verb, "reversible": reversible, "highImpact": high_impact, "reason": reason}
+
+
+def test_unknown_verb_is_left_to_the_llm():
+    assert classify_action("Investigate the role", "Dev-Role") is None
+
+
+# One phrase per privileged pattern
+PRIVILEGED = [
+    "AdministratorAccess",
+    "AmazonS3FullAccess",
+    "AmazonS3FullControl",
+    "PowerUserAccess",
+    "IAMFullAccess",
+    "the root user",
+    "the root account",
+    "a service control policy",
+    "the SCP",
+    "a permissions boundary",
+    "AWS Organizations",
+    '{"Action": "*"}',
+    "Action *",
+    'allow "*:*"',
+    "allow *:*",
+    "allow iam:*",
+    '{"Principal": "*"}',
+    '{"Principal": {"AWS": "*"}}',
+    "Principal *",
+    "make the bucket public",
+    "a public-read ACL",
+    "grant AllUsers read",
+    "grant AuthenticatedUsers read",
+    "create an access key",
+]
+
+
+@pytest.mark.parametrize("text", PRIVILEGED)
+def test_privileged_resource(text):
+    assert PRIVILEGED_RESOURCE_RE.search(text)
+
+
+@pytest.mark.parametrize("text", ["AmazonS3ReadOnlyAccess", "arn:aws:s3:::reports/2024", "the public docs", "a 2*3 grid"])
+def test_not_privileged(text):
+    assert not PRIVILEGED_RESOURCE_RE.search(text)
+
+
+def test_parse_diagnosis():
+    text = (
+        "**ROOT_CAUSE:** Missing permission\n"
+        "**SERVICE:** IAM\n"
+        "**CONFIGURATION_ITEM:** `Dev-App-Role`\n"
+        "**REQUIRED_ACTION:**\n"
+        "Attach the policy AmazonS3ReadOnlyAccess\n"
+        "to IAM role Dev-App-Role\n"
+    )
+    assert parse_diagnosis(text) == {
+        "ROOT_CAUSE": "Missing permission",
+        "SERVICE": "IAM",
+        "CONFIGURATION_ITEM": "Dev-App-Role",
+        "REQUIRED_ACTION": "Attach the policy AmazonS3ReadOnlyAccess to IAM role Dev-App-Role",
+    }
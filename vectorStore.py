@@ -0,0 +1,30 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+
+PINECONE_INDEX_NAME = "rag"
+
+# pinecone | local
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+
+
+def open_index(backend: str = None):
+    """
+    Return the vector index used by retrieval and ingestion.
+    Both backends expose upsert / query / delete / fetch with the same
+    namespace semantics, so callers never need to know which one they got.
+    """
+    backend = backend or VECTOR_BACKEND
+
+    if backend == "pinecone":
+        from pinecone import Pinecone
+        pc = Pinecone(api_key = f"{PINECONE_API_KEY}")
+        return pc.Index(PINECONE_INDEX_NAME)
+
+    if backend == "local":
+        from localIndex import LocalIndex
+        return LocalIndex()
+
+    raise ValueError(f"Unknown vector backend: {backend}")